@@ -9,18 +9,50 @@ __email__ = 'y.sekiguchi@aist.go.jp'
 __status__ = 'Development'
 
 import logging
-from GPMsDB_tk.calc import CalcHit
+
+import numpy as np
+
+from GPMsDB_tk.defaultValues import DefaultValues
+from GPMsDB_tk.calcvec import CalcHitShifts, CalcHitSubset, CalcBitsetShifts, CalcPpmErrorsDb
+from GPMsDB_tk.massdb import MassDB
 
 
 class AdjustMZ():
     def __init__(self):
         self.logger = logging.getLogger('GPMsDB_tk')
 
-    def run(self, peaks, range_ms, num, db, tax):
+    def run(self, peaks, range_ms, num, db, tax, calibration='bins', engine='exact'):
+        if calibration == 'continuous':
+            return self.runContinuous(peaks, range_ms, db, tax)
+
         self.logger.info(
             "m/z adjustment using the ribosomal protein database.")
 
         scan = float(range_ms / num)
+        if not isinstance(db, MassDB):
+            db = MassDB.fromDict(db)
+
+        # all shifts are scored in a single pass over the reference masses
+        shifts = list(range(0, num + 1)) + [-1 * b for b in range(1, num + 1)]
+        if engine == 'bitset':
+            hits, exact = CalcBitsetShifts(self, peaks, scan, 200, shifts, db)
+        else:
+            hits, exact = CalcHitShifts(
+                self, peaks, scan, 200, shifts, db, "adjust", use_index=True)
+        best = hits.argmax(axis=1) if hits.shape[1] > 0 else None
+
+        # the bitset only ranks the genomes; the best one of every shift is
+        # scored again for its exact hits and deviation
+        if engine == 'bitset' and best is not None:
+            for bin, b in enumerate(shifts):
+                h, e = CalcHitSubset(self, peaks, scan, 200, b, db, best[bin:bin + 1], "adjust")
+                if h[0] == 0:
+                    # only masses just outside the windows were counted
+                    h, e = CalcHitShifts(self, peaks, scan, 200, [b], db, "adjust", use_index=True)
+                    best[bin] = int(h[0].argmax())
+                    h, e = h[0, best[bin]:best[bin] + 1], e[0, best[bin]:best[bin] + 1]
+                hits[bin, best[bin]] = h[0]
+                exact[bin, best[bin]] = e[0]
 
         c = {}
         d = {}
@@ -28,23 +60,23 @@ class AdjustMZ():
         r = {}
         result = {}
 
-        for bin in range(0, num + 1):
-            c[bin] = {}
-            d[bin] = {}
+        for bin in range(0, 2 * num + 1):
             q[bin] = 0
+            result[bin] = []
+            if best is None:
+                continue
+            l = db.ids[best[bin]]
+            result[bin] = [l]
+            c[bin] = {l: int(hits[bin, best[bin]])}
+            d[bin] = {l: float(exact[bin, best[bin]])}
 
-            c[bin], d[bin] = CalcHit(self, peaks, scan, 200, bin, db, "adjust")
-
-            result_init = sorted(
-                c[bin].items(), key=lambda x: x[1], reverse=True)[:int(1)]
-            result[bin] = dict(result_init)
-
+        for bin in range(0, num + 1):
             self.logger.info("---itaration " + str(1 + bin) +
                              ": +" + str(bin * scan) + " ppm")
             self.logger.info('\t' + "genome id" + '\t' + "n of hits" +
                              '\t' + "average deviation (ppm)" + "\t" + "organism")
             r[bin] = int(bin * scan)
-            for l in result[bin].keys():
+            for l in result[bin]:
                 try:
                     tax_line = tax[l]
                 except:
@@ -57,16 +89,6 @@ class AdjustMZ():
             bin = bin2 + num
             bin3 = -1 * bin2
             r[bin] = bin3 * scan
-            c[bin] = {}
-            d[bin] = {}
-            q[bin] = 0
-
-            c[bin], d[bin] = CalcHit(
-                self, peaks, scan, 200, bin3, db, "adjust")
-
-            result_init = sorted(
-                c[bin].items(), key=lambda x: x[1], reverse=True)[:int(1)]
-            result[bin] = dict(result_init)
 
             self.logger.info("---itaration " + str(1 + bin) +
                              ": " + str(r[bin]) + " ppm",)
@@ -96,3 +118,54 @@ class AdjustMZ():
                     break
 
         return adjust
+
+    def runContinuous(self, peaks, range_ms, db, tax):
+        self.logger.info(
+            "m/z adjustment (continuous) using the ribosomal protein database.")
+
+        # signed ppm errors of all peak-mass pairs within range_ms (one pass)
+        gs, qs, err = CalcPpmErrorsDb(peaks, range_ms, db, use_index=True)
+        if len(err) == 0:
+            self.logger.info("---Final result ")
+            self.logger.info("\tNo ribosomal protein masses found within " +
+                             str(range_ms) + " ppm, 0.0 ppm, 0")
+            return 0
+
+        # densest window of +/- TORELANCE ppm within a single genome, the
+        # continuous counterpart of the best (bin, genome) of run()
+        width = 2 * DefaultValues.TORELANCE
+        order = np.lexsort((err, gs))
+        gs = gs[order]
+        qs = qs[order]
+        err = err[order]
+        key = gs * (2 * range_ms + width + 1) + (err + range_ms)
+        cnt = np.searchsorted(key, key + width, side='right') - np.arange(len(key))
+        best = int(cnt.argmax())
+
+        l = db.ids[int(gs[best])]
+        e = err[best:best + cnt[best]]
+        hits = len(np.unique(qs[best:best + cnt[best]]))
+
+        # peak of the Gaussian kernel density of the errors in that window
+        h = DefaultValues.CALIB_BANDWIDTH
+        grid = np.arange(e[0], e[0] + width + DefaultValues.CALIB_STEP,
+                         DefaultValues.CALIB_STEP)
+        density = np.zeros(len(grid))
+        for x in e:
+            density += np.exp(-0.5 * ((grid - x) / h) ** 2)
+        adjust = float(grid[density.argmax()])
+
+        self.logger.info('\t' + "genome id" + '\t' + "n of hits" +
+                         '\t' + "average deviation (ppm)" + "\t" + "organism")
+        try:
+            tax_line = tax[l]
+        except:
+            tax_line = "not defined"
+        self.logger.info('\t' + str(l) + '\t' + str(hits) + '\t' + '{:.1f}'.format(
+            float(e.mean())) + "\t" + str(tax_line))
+
+        self.logger.info("---Final result ")
+        self.logger.info(
+            "\tBest adjustment: " + '{:.1f}'.format(adjust) + " ppm, " + str(hits))
+
+        return adjust
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+
+__author__ = 'Yuji Sekiguchi'
+__copyright__ = 'Copyright (c) 2023 Yuji Sekiguchi, National Institute of Advanced Industrial Science and Technology (AIST)'
+__credits__ = ['Yuji Sekiguchi']
+__license__ = 'GPL3.0'
+__maintainer__ = 'Yuji Sekiguchi'
+__email__ = 'y.sekiguchi@aist.go.jp'
+__status__ = 'Development'
+
+import os
+import glob
+import shutil
+import logging
+from collections import OrderedDict
+
+import numpy as np
+
+from GPMsDB_tk.defaultValues import DefaultValues
+from GPMsDB_tk.massdb import OFFSET_FILE, ID_FILE, columnarPath, readIds, writeIds
+
+ANNOTATION_SUFFIX = '_annotation.tsv'
+MASS_FILE = 'masses.bin'
+LABEL_FILE = 'labels.bin'
+LABEL_OFFSET_FILE = 'label_offsets.npy'
+UPDATED_FILE = 'updated.txt'
+
+
+class AnnotationArchive(object):
+    """Annotation tables of all genomes packed into one directory.
+
+    masses.bin holds the protein masses of every genome back to back (sorted
+    by mass within a genome, delimited by offsets) and labels.bin the
+    matching "name<tab>mass" labels as newline-terminated UTF-8 text,
+    delimited per genome by label_offsets. Both are memory-mapped.
+    Genomes listed in updated.txt (replaced by a delta update since the
+    archive was built) are left to their annotation files.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offsets = np.load(os.path.join(path, OFFSET_FILE))
+        self.label_offsets = np.load(os.path.join(path, LABEL_OFFSET_FILE))
+        with open(os.path.join(path, ID_FILE)) as f:
+            self.index = {line.rstrip('\n'): i for i, line in enumerate(f)}
+        self.updated = set()
+        if os.path.isfile(os.path.join(path, UPDATED_FILE)):
+            self.updated = set(readIds(path, UPDATED_FILE))
+
+        # np.memmap refuses empty files
+        self.masses = np.empty(0, dtype='<f8')
+        if self.offsets[-1] > 0:
+            self.masses = np.memmap(os.path.join(path, MASS_FILE), dtype='<f8', mode='r')
+        self.labels = b''
+        if self.label_offsets[-1] > 0:
+            self.labels = np.memmap(os.path.join(path, LABEL_FILE), dtype=np.uint8, mode='r')
+
+    def __contains__(self, genome_id):
+        return genome_id in self.index and genome_id not in self.updated
+
+    def table(self, genome_id):
+        i = self.index[genome_id]
+        masses = np.array(self.masses[self.offsets[i]:self.offsets[i + 1]], dtype=np.float64)
+        text = bytes(self.labels[self.label_offsets[i]:self.label_offsets[i + 1]]).decode('utf-8')
+
+        return masses, text.split('\n')[:-1]
+
+
+def loadAnnotation(reference_file):
+    # reference proteins sorted by mass, with their "name<tab>mass" labels
+    masses = []
+    labels = []
+    for line in open(reference_file):
+        lineSplit = line.split('\t')
+        if lineSplit[0] == '#' or lineSplit[0] == '':
+            continue
+
+        peak = lineSplit[0].rstrip()
+        masses.append(float(peak))
+        labels.append(str(lineSplit[1].rstrip() + "\t" + peak))
+
+    masses = np.array(masses, dtype=np.float64)
+    order = np.argsort(masses, kind='stable')
+
+    return masses[order], [labels[n] for n in order]
+
+
+class AnnotationStore(object):
+    """Per-process access to the annotation tables of a genome directory.
+
+    Tables come from the archive next to the directory (genomes.cdb) when
+    it holds the genome, and from the <genome>_annotation.tsv file
+    otherwise. The most recently used tables are kept parsed.
+    """
+
+    def __init__(self, db, size=DefaultValues.ANNOTATION_CACHE):
+        self.db = db
+        self.size = size
+        self.cache = OrderedDict()
+
+        self.archive = None
+        path = columnarPath(db)
+        if os.path.isdir(path):
+            self.archive = AnnotationArchive(path)
+
+    def get(self, genome_ref):
+        if genome_ref in self.cache:
+            self.cache.move_to_end(genome_ref)
+            return self.cache[genome_ref]
+
+        if self.archive is not None and genome_ref in self.archive:
+            table = self.archive.table(genome_ref)
+        else:
+            reference_file = os.path.join(self.db, genome_ref + ANNOTATION_SUFFIX)
+            if not os.path.exists(reference_file):
+                return None
+            table = loadAnnotation(reference_file)
+
+        self.cache[genome_ref] = table
+        if len(self.cache) > self.size:
+            self.cache.popitem(last=False)
+
+        return table
+
+
+stores = {}
+
+
+def getAnnotation(genome_ref, db):
+    # one store per genome directory and process (workers build their own)
+    if db not in stores:
+        stores[db] = AnnotationStore(db)
+
+    return stores[db].get(genome_ref)
+
+
+def convertAnnotations(genome_dir, overwrite=False):
+    logger = logging.getLogger('GPMsDB_tk')
+
+    path = columnarPath(genome_dir)
+    if os.path.isdir(path) and not overwrite:
+        logger.info('Annotation archive already exists: ' + path)
+        return path
+
+    files = sorted(glob.glob(os.path.join(genome_dir, '*' + ANNOTATION_SUFFIX)))
+
+    # written under a temporary name so that a partial archive is never used
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    ids = []
+    offsets = np.zeros(len(files) + 1, dtype=np.int64)
+    label_offsets = np.zeros(len(files) + 1, dtype=np.int64)
+    with open(os.path.join(tmp_path, MASS_FILE), 'wb') as fm, \
+            open(os.path.join(tmp_path, LABEL_FILE), 'wb') as fl:
+        for i, reference_file in enumerate(files):
+            ids.append(os.path.basename(reference_file)[:-len(ANNOTATION_SUFFIX)])
+            masses, labels = loadAnnotation(reference_file)
+            text = ''.join(label + '\n' for label in labels).encode('utf-8')
+
+            fm.write(masses.astype('<f8').tobytes())
+            fl.write(text)
+            offsets[i + 1] = offsets[i] + len(masses)
+            label_offsets[i + 1] = label_offsets[i] + len(text)
+
+    np.save(os.path.join(tmp_path, OFFSET_FILE), offsets)
+    np.save(os.path.join(tmp_path, LABEL_OFFSET_FILE), label_offsets)
+    writeIds(ids, tmp_path)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(tmp_path, path)
+
+    logger.info('Converted ' + genome_dir + ' (' + str(len(ids)) +
+                ' genomes, ' + str(int(offsets[-1])) + ' proteins) to ' + path)
+
+    return path
+
+
+def markUpdated(genome_dir, ids):
+    # genomes whose annotation files were replaced after the archive was
+    # built; they are read from the files until the archive is rebuilt
+    path = columnarPath(genome_dir)
+    if not os.path.isdir(path) or len(ids) == 0:
+        return
+
+    with open(os.path.join(path, UPDATED_FILE), 'a') as f:
+        for g in ids:
+            f.write(str(g) + '\n')
+
+
+def compactAnnotations(genome_dir):
+    # rebuild the archive when annotation files were updated since
+    path = columnarPath(genome_dir)
+    if not os.path.isfile(os.path.join(path, UPDATED_FILE)):
+        return False
+
+    convertAnnotations(genome_dir, True)
+
+    return True
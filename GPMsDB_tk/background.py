@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+__author__ = 'Yuji Sekiguchi'
+__copyright__ = 'Copyright (c) 2023 Yuji Sekiguchi, National Institute of Advanced Industrial Science and Technology (AIST)'
+__credits__ = ['Yuji Sekiguchi']
+__license__ = 'GPL3.0'
+__maintainer__ = 'Yuji Sekiguchi'
+__email__ = 'y.sekiguchi@aist.go.jp'
+__status__ = 'Development'
+
+import os
+import sys
+import json
+import logging
+import statistics
+
+import numpy as np
+
+from GPMsDB_tk.defaultValues import DefaultValues
+from GPMsDB_tk.calcvec import CalcHitSubset, CalcScoreArray
+from GPMsDB_tk.massdb import massValues
+
+SCORE_TYPES = ['weighted', 'unweighted', 'ms']
+
+
+class Background(object):
+    """Random-background score model of a reference database.
+
+    Genomes are drawn in the order of a seeded permutation of their ids
+    that is built once per database, so the random sampling scores are
+    reproducible and do not depend on how the database is laid out. With
+    a precomputed table (see buildBackground) the mean and standard deviation
+    are looked up by peak count instead of rescoring the sampled genomes.
+    """
+
+    def __init__(self, seed=DefaultValues.RANDOM_SEED, table=None):
+        self.seed = seed
+        self.table = table
+
+    def sample(self, db, pool, size=DefaultValues.RANDOM_SAMPLE):
+        key = ('background', self.seed)
+        if key not in db.columns:
+            # live genomes sorted by id before the permutation, so that
+            # delta segments, compaction and conversion give the same order
+            live = np.ones(len(db), dtype=bool)
+            live[db.dead] = False
+            live = np.flatnonzero(live)
+            live = live[np.argsort(np.array(list(db.ids))[live], kind='stable')]
+            db.columns[key] = live[np.random.default_rng(self.seed).permutation(len(live))]
+        order = db.columns[key]
+
+        mask = np.zeros(len(db), dtype=bool)
+        mask[pool] = True
+
+        return order[mask[order]][:size]
+
+    def lookup(self, score_type, n_peaks, ppm):
+        if self.table is None or score_type not in self.table or self.table['ppm'] != ppm:
+            return None
+
+        peaks = self.table['peaks']
+        mean = float(np.interp(n_peaks, peaks, self.table[score_type]['mean']))
+        stdev = float(np.interp(n_peaks, peaks, self.table[score_type]['stdev']))
+
+        return mean, stdev
+
+
+def backgroundPath(reference):
+    return os.path.join(DefaultValues.GPMsDB_PATH, 'mass', 'background_' + reference + '.json')
+
+
+def drawMasses(rng, db, n):
+    # rng.choice(masses, n) over the masses of all segments of db
+    segments = [s for start, s in db.segments]
+    if len(segments) == 1:
+        return massValues(rng.choice(np.asarray(segments[0].masses), n), segments[0].scale)
+
+    sizes = np.array([len(s.masses) for s in segments])
+    ends = np.cumsum(sizes)
+    idx = rng.integers(0, ends[-1], n)
+    part = np.searchsorted(ends, idx, side='right')
+    local = idx - (ends - sizes)[part]
+
+    masses = np.empty(n, dtype=np.float64)
+    for k, s in enumerate(segments):
+        sel = part == k
+        masses[sel] = massValues(np.asarray(s.masses)[local[sel]], s.scale)
+
+    return masses
+
+
+def loadBackground(reference, reps_db, seed=DefaultValues.RANDOM_SEED):
+    logger = logging.getLogger('GPMsDB_tk')
+
+    path = backgroundPath(reference)
+    if not os.path.isfile(path):
+        logger.error('Background table not found: ' + path +
+                     ' (run "GPMsDB_tk background -r ' + reference + '" first)')
+        sys.exit(1)
+
+    with open(path) as f:
+        table = json.load(f)
+
+    if table['genomes'] != len(reps_db):
+        logger.error('Background table ' + path + ' was built for ' + str(table['genomes']) +
+                     ' genomes, the reference has ' + str(len(reps_db)) + '. Please rebuild it.')
+        sys.exit(1)
+
+    return Background(seed, table)
+
+
+def buildBackground(reference, reps_db, all_db, genes, seed=DefaultValues.RANDOM_SEED,
+                    repeats=DefaultValues.BACKGROUND_REPEATS):
+    # synthetic peak lists are drawn from the mass distribution of the
+    # reference proteins (shifted by up to 1%), then scored against the
+    # sampled genomes like the random sampling of SearchBestHit
+    logger = logging.getLogger('GPMsDB_tk')
+    rng = np.random.default_rng(seed)
+    background = Background(seed)
+
+    sample = background.sample(reps_db, np.arange(len(reps_db)))
+    to_all = all_db.align(reps_db)[sample]
+    gene = reps_db.column('genes', genes)[sample]
+
+    table = {'reference': reference, 'seed': seed, 'genomes': len(reps_db),
+             'ppm': DefaultValues.TORELANCE, 'peaks': DefaultValues.BACKGROUND_PEAKS}
+    for score_type in SCORE_TYPES:
+        table[score_type] = {'mean': [], 'stdev': []}
+
+    for n in DefaultValues.BACKGROUND_PEAKS:
+        means = {score_type: [] for score_type in SCORE_TYPES}
+        stdevs = {score_type: [] for score_type in SCORE_TYPES}
+        for _ in range(repeats):
+            m = drawMasses(rng, all_db, n)
+            peaks = np.sort(m * (1 + rng.uniform(-0.01, 0.01, n)))
+
+            hit, exact = CalcHitSubset(None, peaks, 0, DefaultValues.TORELANCE, 1,
+                                       reps_db, sample, 'ms')
+            hit_all, exact_all = CalcHitSubset(None, peaks, 0, DefaultValues.TORELANCE, 1,
+                                               all_db, to_all, 'ms', by_mass=True)
+            for score_type in SCORE_TYPES:
+                scores = CalcScoreArray(score_type, hit, hit_all, exact, exact_all, gene)
+                scores = scores[~np.isnan(scores)].tolist()
+                means[score_type].append(statistics.mean(scores))
+                stdevs[score_type].append(statistics.stdev(scores))
+
+        for score_type in SCORE_TYPES:
+            table[score_type]['mean'].append(statistics.mean(means[score_type]))
+            table[score_type]['stdev'].append(statistics.mean(stdevs[score_type]))
+        logger.info('\t' + str(n) + ' peaks: ' + ', '.join(
+            score_type + ' ' + '{:.4f}'.format(table[score_type]['mean'][-1]) + ' (' +
+            '{:.4f}'.format(table[score_type]['stdev'][-1]) + ')' for score_type in SCORE_TYPES))
+
+    path = backgroundPath(reference)
+    with open(path, 'w') as f:
+        json.dump(table, f, indent=1)
+    logger.info('Background table saved to ' + path)
+
+    return table
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+__author__ = 'Yuji Sekiguchi'
+__copyright__ = 'Copyright (c) 2023 Yuji Sekiguchi, National Institute of Advanced Industrial Science and Technology (AIST)'
+__credits__ = ['Yuji Sekiguchi']
+__license__ = 'GPL3.0'
+__maintainer__ = 'Yuji Sekiguchi'
+__email__ = 'y.sekiguchi@aist.go.jp'
+__status__ = 'Development'
+
+import os
+import json
+import logging
+
+import numpy as np
+
+from GPMsDB_tk.defaultValues import DefaultValues
+from GPMsDB_tk.massdb import openMassDb, massValues
+from GPMsDB_tk.massindex import massBins
+
+BITSET_DIR = 'bitset'
+
+
+class BitsetIndex(object):
+    """Genomes as sets of occupied log-m/z bins, for hit counting only.
+
+    Bins are log(1 + bin_ppm / 1e6) wide. A query is the set of bins its
+    tolerance windows overlap and the hits of a genome are the size of the
+    intersection with its set, i.e. the popcount of AND over bitmaps.
+
+    Despite the name, no bit arrays are kept: a bitmap of millions of bins
+    per genome, or a roaring bitmap library (not a dependency), would not
+    fit the memory-mapped numpy layout of the other indexes. Every (bin,
+    genome) pair with at least one mass of the genome in the bin is stored
+    once instead, sorted by bin, so the bins of a query are contiguous
+    slices found with searchsorted and the popcounts of all genomes are a
+    bincount over those slices (see hits).
+    """
+
+    def __init__(self, bin_ppm, n_genomes, bins, genomes):
+        self.bin_ppm = bin_ppm
+        self.width = np.log1p(bin_ppm / 1000000)
+        self.n_genomes = n_genomes
+        self.bins = bins
+        self.genomes = genomes
+
+    @classmethod
+    def build(cls, masses, offsets, bin_ppm=DefaultValues.BITSET_PPM):
+        n_genomes = len(offsets) - 1
+        width = np.log1p(bin_ppm / 1000000)
+        bins = massBins(np.asarray(masses, dtype=np.float64), width)
+        genomes = np.repeat(np.arange(n_genomes, dtype=np.int64), np.diff(offsets))
+
+        # masses sharing a bin are one bit
+        pairs = np.unique(bins * max(n_genomes, 1) + genomes)
+        bins = (pairs // max(n_genomes, 1)).astype(np.int32)
+        genomes = (pairs % max(n_genomes, 1)).astype(np.int32)
+
+        return cls(bin_ppm, n_genomes, bins, genomes)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'bins.npy'), self.bins)
+        np.save(os.path.join(path, 'genomes.npy'), self.genomes)
+        with open(os.path.join(path, 'bitset.json'), 'w') as f:
+            json.dump({'bin_ppm': self.bin_ppm, 'n_genomes': self.n_genomes}, f)
+
+    @classmethod
+    def open(cls, path):
+        with open(os.path.join(path, 'bitset.json')) as f:
+            meta = json.load(f)
+
+        return cls(meta['bin_ppm'], meta['n_genomes'],
+                   np.load(os.path.join(path, 'bins.npy'), mmap_mode='r'),
+                   np.load(os.path.join(path, 'genomes.npy'), mmap_mode='r'))
+
+    def hits(self, lower, upper):
+        # hit counts of all genomes for the windows lower[i]:upper[i];
+        # windows overlapping in bins are merged and hit at most once per
+        # window, so a genome scores min(bits in the merged window, windows)
+        if len(lower) == 0 or len(self.bins) == 0:
+            return np.zeros(self.n_genomes, dtype=np.int64)
+
+        lo = massBins(lower, self.width)
+        hi = massBins(upper, self.width)
+        order = np.argsort(lo, kind='stable')
+        lo = lo[order]
+        reach = np.maximum.accumulate(hi[order])
+        start = np.flatnonzero(np.r_[True, lo[1:] > reach[:-1]])
+        end = np.r_[start[1:], len(lo)]
+        windows = end - start
+
+        # slices of the pairs inside each merged window
+        a = np.searchsorted(self.bins, lo[start].astype(self.bins.dtype), side='left')
+        b = np.searchsorted(self.bins, reach[end - 1].astype(self.bins.dtype), side='right')
+        cnt = b - a
+        ws = np.repeat(np.arange(len(start)), cnt)
+        ps = np.arange(len(ws)) - np.repeat(np.cumsum(cnt) - cnt, cnt) + np.repeat(a, cnt)
+        key, bits = np.unique(ws * self.n_genomes + np.asarray(self.genomes[ps], dtype=np.int64),
+                              return_counts=True)
+        hits = np.bincount(key % self.n_genomes, weights=np.minimum(bits, windows[key // self.n_genomes]),
+                           minlength=self.n_genomes)
+
+        return hits.astype(np.int64)
+
+
+def getBitsetIndex(db):
+    if db.bitset is not None:
+        return db.bitset
+
+    if db.path is not None and os.path.isdir(os.path.join(db.path, BITSET_DIR)):
+        db.bitset = BitsetIndex.open(os.path.join(db.path, BITSET_DIR))
+    else:
+        logger = logging.getLogger('GPMsDB_tk')
+        logger.info('Building m/z bitset index (' + str(len(db)) + ' genomes).')
+        db.bitset = BitsetIndex.build(massValues(db.masses, db.scale), db.offsets)
+
+    return db.bitset
+
+
+def buildBitsetIndex(path):
+    db = openMassDb(path)
+    index = BitsetIndex.build(massValues(db.masses, db.scale), db.offsets)
+    index.save(os.path.join(path, BITSET_DIR))
+
+    logger = logging.getLogger('GPMsDB_tk')
+    logger.info('m/z bitset index (' + str(len(index.bins)) +
+                ' bits) saved to ' + os.path.join(path, BITSET_DIR))
+
+    return index
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+__author__ = 'Yuji Sekiguchi'
+__copyright__ = 'Copyright (c) 2023 Yuji Sekiguchi, National Institute of Advanced Industrial Science and Technology (AIST)'
+__credits__ = ['Yuji Sekiguchi']
+__license__ = 'GPL3.0'
+__maintainer__ = 'Yuji Sekiguchi'
+__email__ = 'y.sekiguchi@aist.go.jp'
+__status__ = 'Development'
+
+import os
+import threading
+from collections import ChainMap
+from concurrent.futures import Future
+
+from GPMsDB_tk.common import selectDb
+from GPMsDB_tk.defaultValues import DefaultValues
+from GPMsDB_tk.massdb import MassOverlay, loadDb, loadMassDb, columnarPath, deltaSegments
+
+MASS_TABLES = ['reps', 'all']
+
+
+class DatabaseBundle(object):
+    """Reference tables of one reference/taxonomy setting.
+
+    Each table (with the custom entries laid over it for the custom
+    reference) is loaded on first access and only once; prefetch() loads tables in
+    background threads so that loading overlaps the m/z adjustment.
+    """
+
+    def __init__(self, reference, taxonomy):
+        tax_db, reps_db, all_db, strain_list, no_genes = selectDb(reference, taxonomy)
+
+        self.reference = reference
+        self.files = {'reps': reps_db, 'all': all_db, 'tax': tax_db, 'strain': strain_list,
+                      'genes': no_genes, 'ncbi': DefaultValues.TAX_NCBI}
+        self.custom = {}
+        if reference == 'custom':
+            self.custom = {'reps': DefaultValues.CUSTOM_LIST_R, 'all': DefaultValues.CUSTOM_LIST_O,
+                           'tax': DefaultValues.CUSTOM_LIST_TAX, 'genes': DefaultValues.CUSTOM_LIST_GENES,
+                           'ncbi': DefaultValues.CUSTOM_LIST_NAME}
+
+        self.tables = {}
+        self.lock = threading.Lock()
+
+    def load(self, name):
+        # custom entries are laid over the base tables, which are neither
+        # copied nor modified
+        if name in MASS_TABLES:
+            table = loadMassDb(self.files[name])
+            if name in self.custom:
+                table = MassOverlay(table, loadMassDb(self.custom[name]))
+        else:
+            table = loadDb(self.files[name])
+            if name in self.custom:
+                table = ChainMap(loadDb(self.custom[name]), table)
+
+        return table
+
+    def get(self, name):
+        # the first caller loads the table, later (or concurrent) callers
+        # wait for the same result
+        with self.lock:
+            owner = name not in self.tables
+            if owner:
+                self.tables[name] = Future()
+            future = self.tables[name]
+
+        if owner:
+            try:
+                future.set_result(self.load(name))
+            except BaseException as e:
+                future.set_exception(e)
+
+        return future.result()
+
+    def prefetch(self, *names):
+        for name in names:
+            threading.Thread(target=self.fetch, args=(name,), daemon=True).start()
+
+    def fetch(self, name):
+        # errors surface when the table is used
+        try:
+            self.get(name)
+        except BaseException:
+            pass
+
+    def fingerprint(self):
+        # sizes and modification times of the files the tables are read
+        # from, without loading them
+        stamps = []
+        for name in sorted(self.files):
+            for db_file in [self.files[name], self.custom.get(name)]:
+                if db_file is None:
+                    continue
+                # the pickle too, it is read when changed after the conversion
+                path = columnarPath(db_file)
+                paths = [db_file]
+                if os.path.isdir(path):
+                    paths += [os.path.join(path, f) for f in sorted(os.listdir(path))]
+                for delta in deltaSegments(db_file):
+                    paths += [os.path.join(delta, f) for f in sorted(os.listdir(delta))]
+                for p in paths:
+                    if os.path.isfile(p):
+                        st = os.stat(p)
+                        stamps.append([os.path.basename(p), st.st_size, st.st_mtime_ns])
+
+        return stamps
+
+    @property
+    def reps(self):
+        return self.get('reps')
+
+    @property
+    def all(self):
+        return self.get('all')
+
+    @property
+    def tax(self):
+        return self.get('tax')
+
+    @property
+    def strain(self):
+        return self.get('strain')
+
+    @property
+    def genes(self):
+        return self.get('genes')
+
+    @property
+    def ncbi(self):
+        return self.get('ncbi')
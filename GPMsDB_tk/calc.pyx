@@ -11,7 +11,7 @@ __status__ = 'Development'
 import random
 from GPMsDB_tk.defaultValues import DefaultValues
 
-cpdef tuple CalcHit(self, list peaks, double scan, int ppm, int bin, dict db, str s_type):
+cpdef tuple CalcHit(self, list peaks, double scan, int ppm, int bin, db, str s_type):
     cdef:
       int b
       str i
@@ -64,7 +64,7 @@ cpdef tuple CalcHit(self, list peaks, double scan, int ppm, int bin, dict db, st
     return c,d
 
 
-cpdef tuple CalcRamdom(self, list ramdom_list, list peaks, double scan, int ppm, int bin, dict db, str s_type):
+cpdef tuple CalcRamdom(self, list ramdom_list, list peaks, double scan, int ppm, int bin, db, str s_type):
     cdef:
       int b
       str i
@@ -0,0 +1,423 @@
+#!/usr/bin/env python
+
+__author__ = 'Yuji Sekiguchi'
+__copyright__ = 'Copyright (c) 2023 Yuji Sekiguchi, National Institute of Advanced Industrial Science and Technology (AIST)'
+__credits__ = ['Yuji Sekiguchi']
+__license__ = 'GPL3.0'
+__maintainer__ = 'Yuji Sekiguchi'
+__email__ = 'y.sekiguchi@aist.go.jp'
+__status__ = 'Development'
+
+import numpy as np
+
+from GPMsDB_tk.calc import CalcHit
+from GPMsDB_tk.defaultValues import DefaultValues
+from GPMsDB_tk.massdb import MassDB, massKeys, massValues
+from GPMsDB_tk.massindex import getMassIndex
+from GPMsDB_tk.bitset import getBitsetIndex
+
+CHUNK = 1 << 22         #number of reference masses scanned at once
+
+
+def QueryWindows(peaks, scan, ppm, bin):
+    # CalcHit keeps query peaks in a C float and the tolerance in a C int
+    q = np.asarray(peaks, dtype=np.float32).astype(np.float64)
+    ppm = int(ppm)
+    shift = q * scan * bin / 1000000
+    upper = q + (q * ppm / 1000000) + shift
+    lower = q - (q * ppm / 1000000) + shift
+
+    return q, lower, upper, shift
+
+
+def CandidatePairs(lower, upper, masses, start=0):
+    # (mass index, query index) for every reference mass inside a query window
+    js = []
+    qs = []
+    for n in range(0, len(masses), CHUNK):
+        m = masses[n:n + CHUNK]
+        qa = np.searchsorted(upper, m, side='right')
+        qb = np.searchsorted(lower, m, side='left')
+        cand = np.flatnonzero(qa < qb)
+        if len(cand) == 0:
+            continue
+        qa = qa[cand]
+        cnt = qb[cand] - qa
+        rep = np.repeat(np.arange(len(cand)), cnt)
+        within = np.arange(len(rep)) - np.repeat(np.cumsum(cnt) - cnt, cnt)
+        js.append(cand[rep] + n + start)
+        qs.append(qa[rep] + within)
+
+    if len(js) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    return np.concatenate(js), np.concatenate(qs)
+
+
+def ResolvePairs(js, qs, gs, n_genomes):
+    # greedy matching of CalcHit: peaks are taken in ascending order and each
+    # one consumes the lowest in-window mass not consumed by an earlier peak
+    order = np.lexsort((js, qs))
+    js = js[order]
+    qs = qs[order]
+    gs = gs[order]
+
+    nxt = np.zeros(n_genomes, dtype=np.int64)
+    bounds = np.flatnonzero(np.diff(qs)) + 1
+    mj = []
+    mg = []
+    mq = []
+    for a, b in zip(np.r_[0, bounds], np.r_[bounds, len(qs)]):
+        j = js[a:b]
+        g = gs[a:b]
+        ok = j >= nxt[g]
+        j = j[ok]
+        g = g[ok]
+        if len(g) == 0:
+            continue
+        first = np.r_[True, g[1:] != g[:-1]]
+        j = j[first]
+        g = g[first]
+        nxt[g] = j + 1
+        mj.append(j)
+        mg.append(g)
+        mq.append(np.full(len(g), qs[a]))
+
+    if len(mj) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+
+    return np.concatenate(mj), np.concatenate(mg), np.concatenate(mq)
+
+
+def ScoreMatches(mj, mg, mq, q, shift, ppm, masses, n_genomes, s_type, by_mass=False,
+                 scale=None):
+    # np.bincount adds in match order, which keeps the ms sums identical
+    # to the peak-by-peak accumulation of CalcHit (CalcRamdom divides the
+    # deviation by the reference mass instead, by_mass=True)
+    hits = np.bincount(mg, minlength=n_genomes)
+    if s_type == "ms":
+        m = massValues(masses[mj], scale)
+        r = np.abs(m - q[mq] + shift[mq]) / (m if by_mass else q[mq]) * 1000000
+        exact = np.bincount(mg, weights=1 - (0.5 * r / int(ppm)),
+                            minlength=n_genomes).astype(np.float64, copy=False)
+    else:
+        exact = np.zeros(n_genomes, dtype=np.float64)
+
+    return hits, exact
+
+
+def CalcHitArray(peaks, scan, ppm, bin, masses, offsets, s_type, index=None, scale=None):
+    # masses in the scale of the database (see massKeys), the windows are
+    # compared in that scale
+    n_genomes = len(offsets) - 1
+    q, lower, upper, shift = QueryWindows(peaks, scan, ppm, bin)
+
+    if index is None:
+        js, qs = CandidatePairs(massKeys(lower, scale), massKeys(upper, scale), masses)
+        gs = np.searchsorted(offsets, js, side='right') - 1
+    else:
+        js, qs, gs = index.postings(lower, upper)
+    mj, mg, mq = ResolvePairs(js, qs, gs, n_genomes)
+
+    return ScoreMatches(mj, mg, mq, q, shift, ppm, masses, n_genomes, s_type, scale=scale)
+
+
+def CalcHitShiftArray(peaks, scan, ppm, bins, masses, offsets, s_type, index=None, scale=None):
+    # candidate pairs are collected once for the union of the windows of all
+    # shifts, then every shift keeps the pairs inside its own window
+    n_genomes = len(offsets) - 1
+    windows = [QueryWindows(peaks, scan, ppm, b) for b in bins]
+    lower = np.min([w[1] for w in windows], axis=0)
+    upper = np.max([w[2] for w in windows], axis=0)
+
+    if index is None:
+        js, qs = CandidatePairs(massKeys(lower, scale), massKeys(upper, scale), masses)
+        gs = np.searchsorted(offsets, js, side='right') - 1
+    else:
+        js, qs, gs = index.postings(lower, upper)
+    m = massValues(masses[js], scale)
+
+    hits = np.zeros((len(bins), n_genomes), dtype=np.int64)
+    exact = np.zeros((len(bins), n_genomes), dtype=np.float64)
+    for n, (q, lower, upper, shift) in enumerate(windows):
+        ok = (lower[qs] < m) & (m < upper[qs])
+        mj, mg, mq = ResolvePairs(js[ok], qs[ok], gs[ok], n_genomes)
+        hits[n], exact[n] = ScoreMatches(
+            mj, mg, mq, q, shift, ppm, masses, n_genomes, s_type, scale=scale)
+
+    return hits, exact
+
+
+def CalcHitSubsetArray(peaks, scan, ppm, bin, masses, offsets, genomes, s_type, by_mass=False,
+                       scale=None):
+    # scores only the genomes at the given positions (-1: absent genome),
+    # reading (and decoding) their mass ranges straight from the shared arrays
+    genomes = np.asarray(genomes, dtype=np.int64)
+    n_genomes = len(genomes)
+    present = genomes >= 0
+    starts = np.where(present, np.asarray(offsets[np.maximum(genomes, 0)]), 0)
+    lengths = np.where(present, np.asarray(offsets[np.maximum(genomes, 0) + 1]) - starts, 0)
+    slot = np.repeat(np.arange(n_genomes), lengths)
+    idx = np.arange(len(slot)) - np.repeat(np.cumsum(lengths) - lengths, lengths) + starts[slot]
+    m = massValues(masses[idx], scale)
+
+    q, lower, upper, shift = QueryWindows(peaks, scan, ppm, bin)
+    js, qs = CandidatePairs(lower, upper, m)
+    mj, mg, mq = ResolvePairs(js, qs, slot[js], n_genomes)
+
+    return ScoreMatches(mj, mg, mq, q, shift, ppm, m, n_genomes, s_type, by_mass)
+
+
+def CalcHitBatchArray(peak_lists, scans, ppm, bin, masses, offsets, s_type, index=None,
+                      scale=None):
+    # the query windows of all spectra are merged (ordered by spectrum, then
+    # by m/z) and matched in one traversal; pairs are keyed by
+    # spectrum * n_genomes + genome so that the greedy matching of each
+    # spectrum stays independent
+    n_genomes = len(offsets) - 1
+    n_spectra = len(peak_lists)
+    windows = [QueryWindows(p, s, ppm, bin) for p, s in zip(peak_lists, scans)]
+    spec = np.repeat(np.arange(n_spectra), [len(w[0]) for w in windows])
+    q, lower, upper, shift = [np.concatenate([w[i] for w in windows]) for i in range(4)]
+
+    if index is None:
+        # windows sorted by their lower edge with a running maximum of the
+        # upper edge give a superset of the windows around each mass
+        order = np.argsort(lower, kind='stable')
+        js, qs = CandidatePairs(massKeys(lower[order], scale),
+                                massKeys(np.maximum.accumulate(upper[order]), scale), masses)
+        qs = order[qs]
+        m = massValues(masses[js], scale)
+        ok = (lower[qs] < m) & (m < upper[qs])
+        js = js[ok]
+        qs = qs[ok]
+        gs = np.searchsorted(offsets, js, side='right') - 1
+    else:
+        js, qs, gs = index.postings(lower, upper)
+
+    gs = spec[qs] * n_genomes + gs
+    mj, mg, mq = ResolvePairs(js, qs, gs, n_spectra * n_genomes)
+    hits, exact = ScoreMatches(
+        mj, mg, mq, q, shift, ppm, masses, n_spectra * n_genomes, s_type, scale=scale)
+
+    return hits.reshape(n_spectra, n_genomes), exact.reshape(n_spectra, n_genomes)
+
+
+def CalcPpmErrors(peaks, range_ms, masses, offsets, index=None, scale=None):
+    # signed ppm error of every reference mass within range_ms of a peak,
+    # i.e. the adjustment that would put that mass at the centre of the window
+    q = np.sort(np.asarray(peaks, dtype=np.float64))
+    lower = q - (q * range_ms / 1000000)
+    upper = q + (q * range_ms / 1000000)
+
+    if index is None:
+        js, qs = CandidatePairs(massKeys(lower, scale), massKeys(upper, scale), masses)
+        gs = np.searchsorted(offsets, js, side='right') - 1
+    else:
+        js, qs, gs = index.postings(lower, upper)
+    m = massValues(masses[js], scale)
+
+    return gs, qs, (m - q[qs]) / q[qs] * 1000000
+
+
+def TopIndices(values, k):
+    # indices of the k largest values in the order of
+    # sorted(..., reverse=True)[:k], i.e. descending with ties by position
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    k = max(0, min(int(k), n))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+
+    t = np.partition(values, n - k)[n - k]
+    above = np.flatnonzero(values > t)
+    tie = np.flatnonzero(values == t)[:k - len(above)]
+    idx = np.concatenate((above, tie))
+
+    return idx[np.lexsort((idx, -values[idx]))]
+
+
+def RestIndices(values, k):
+    # indices outside the k largest values, in position order
+    keep = np.ones(len(values), dtype=bool)
+    keep[TopIndices(values, k)] = False
+
+    return np.flatnonzero(keep)
+
+
+def CalcSegments(db, calc):
+    # calc(segment) for every segment of db (one for a plain MassDB, more
+    # for overlays), joined along the genome axis; shadowed genomes of
+    # overlays never hit
+    parts = [calc(segment) for start, segment in db.segments]
+    if len(parts) == 1:
+        hits, exact = parts[0]
+    else:
+        hits = np.concatenate([p[0] for p in parts], axis=-1)
+        exact = np.concatenate([p[1] for p in parts], axis=-1)
+
+    if len(db.dead) > 0:
+        hits[..., db.dead] = 0
+        exact[..., db.dead] = 0
+
+    return hits, exact
+
+
+def CalcHitDb(self, peaks, scan, ppm, bin, db, s_type, use_index=False):
+    # hit and exact vectors aligned to db.ids (the dense genome index)
+    if not isinstance(db, MassDB):
+        db = MassDB.fromDict(db)
+    if len(peaks) > 1 and not np.all(np.diff(np.asarray(peaks, dtype=np.float32)) >= 0):
+        def calc(s):
+            c, d = CalcHit(self, list(peaks), scan, ppm, bin, s, s_type)
+            return (np.fromiter(c.values(), dtype=np.int64, count=len(s)),
+                    np.fromiter(d.values(), dtype=np.float64, count=len(s)))
+    else:
+        def calc(s):
+            index = getMassIndex(s) if use_index else None
+            return CalcHitArray(peaks, scan, ppm, bin, s.masses, s.offsets, s_type, index, s.scale)
+
+    return CalcSegments(db, calc)
+
+
+def CalcHitSubset(self, peaks, scan, ppm, bin, db, genomes, s_type, by_mass=False):
+    # hit and exact vectors aligned to genomes (positions in db); the
+    # windows must be ordered, as they are for peak lists from PeakLoader
+    if len(peaks) > 1 and not np.all(np.diff(np.asarray(peaks, dtype=np.float32)) >= 0):
+        peaks = sorted(peaks)
+
+    segments = db.segments
+    if len(segments) == 1 and len(db.dead) == 0:
+        s = segments[0][1]
+        return CalcHitSubsetArray(peaks, scan, ppm, bin, s.masses, s.offsets,
+                                  genomes, s_type, by_mass, s.scale)
+
+    # every genome lies in one segment, the others score it zero
+    genomes = np.asarray(genomes, dtype=np.int64)
+    hits = 0
+    exact = 0
+    for start, s in segments:
+        inside = (genomes >= start) & (genomes < start + len(s))
+        h, e = CalcHitSubsetArray(peaks, scan, ppm, bin, s.masses, s.offsets,
+                                  np.where(inside, genomes - start, -1), s_type, by_mass, s.scale)
+        hits = hits + h
+        exact = exact + e
+
+    dead = np.isin(genomes, db.dead)
+    hits[dead] = 0
+    exact[dead] = 0
+
+    return hits, exact
+
+
+def CalcScoreArray(score_type, reps, all, ms_reps, ms_all, genes, limit=True):
+    # CalcScore (limit=True) and CalcScore2 (limit=False) over aligned
+    # vectors; genomes without a gene count score NaN
+    rw = DefaultValues.RIBOSOMAL_WEIGHT
+    genes = np.asarray(genes, dtype=np.float64)
+    if limit:
+        genes = np.where(genes < DefaultValues.GENE_LIMIT, DefaultValues.GENE_LIMIT, genes)
+
+    if score_type == 'weighted':
+        return (rw * np.asarray(reps, dtype=np.float64) + all) / genes
+    elif score_type == 'ms':
+        return (rw * np.asarray(ms_reps, dtype=np.float64) + ms_all) / genes
+    elif score_type == 'unweighted':
+        return (np.asarray(reps, dtype=np.float64) + all) / genes
+
+    return np.full(len(genes), np.nan)
+
+
+def CalcHitShifts(self, peaks, scan, ppm, bins, db, s_type, use_index=False):
+    if not isinstance(db, MassDB):
+        db = MassDB.fromDict(db)
+    if len(peaks) > 1 and not np.all(np.diff(np.asarray(peaks, dtype=np.float32)) >= 0):
+        def calc(s):
+            hits = np.zeros((len(bins), len(s)), dtype=np.int64)
+            exact = np.zeros((len(bins), len(s)), dtype=np.float64)
+            for n, b in enumerate(bins):
+                c, d = CalcHit(self, list(peaks), scan, ppm, b, s, s_type)
+                hits[n] = list(c.values())
+                exact[n] = list(d.values())
+            return hits, exact
+    else:
+        def calc(s):
+            index = getMassIndex(s) if use_index else None
+            return CalcHitShiftArray(peaks, scan, ppm, bins, s.masses, s.offsets, s_type, index,
+                                     s.scale)
+
+    return CalcSegments(db, calc)
+
+
+def CalcHitBatch(self, peak_lists, scans, ppm, bin, db, s_type, use_index=False):
+    # hit and exact vectors of several spectra (one row each) from a single
+    # pass over db; scans are the per-spectrum m/z adjustments
+    if not isinstance(db, MassDB):
+        db = MassDB.fromDict(db)
+    if len(peak_lists) == 0:
+        return (np.zeros((0, len(db)), dtype=np.int64),
+                np.zeros((0, len(db)), dtype=np.float64))
+    if any(len(p) > 1 and not np.all(np.diff(np.asarray(p, dtype=np.float32)) >= 0)
+           for p in peak_lists):
+        rows = [CalcHitDb(self, p, s, ppm, bin, db, s_type, use_index)
+                for p, s in zip(peak_lists, scans)]
+        return np.stack([r[0] for r in rows]), np.stack([r[1] for r in rows])
+
+    def calc(s):
+        index = getMassIndex(s) if use_index else None
+        return CalcHitBatchArray(
+            peak_lists, scans, ppm, bin, s.masses, s.offsets, s_type, index, s.scale)
+
+    return CalcSegments(db, calc)
+
+
+def CalcBitsetShifts(self, peaks, scan, ppm, bins, db):
+    # hit counts of CalcHitShifts from the bitset index (exact is zero): a
+    # peak hits a genome with a mass in any bin its window overlaps, so
+    # masses up to one bin width (BITSET_PPM) outside the window also count
+    if not isinstance(db, MassDB):
+        db = MassDB.fromDict(db)
+
+    def calc(s):
+        index = getBitsetIndex(s)
+        hits = np.zeros((len(bins), len(s)), dtype=np.int64)
+        for n, b in enumerate(bins):
+            q, lower, upper, shift = QueryWindows(np.sort(peaks), scan, ppm, b)
+            hits[n] = index.hits(lower, upper)
+        return hits, np.zeros(hits.shape, dtype=np.float64)
+
+    return CalcSegments(db, calc)
+
+
+def CalcBitsetBatch(self, peak_lists, scans, ppm, bin, db):
+    # CalcHitBatch counterpart of CalcBitsetShifts
+    if not isinstance(db, MassDB):
+        db = MassDB.fromDict(db)
+    if len(peak_lists) == 0:
+        return (np.zeros((0, len(db)), dtype=np.int64),
+                np.zeros((0, len(db)), dtype=np.float64))
+
+    rows = [CalcBitsetShifts(self, p, s, ppm, [bin], db) for p, s in zip(peak_lists, scans)]
+    return np.concatenate([r[0] for r in rows]), np.concatenate([r[1] for r in rows])
+
+
+def CalcPpmErrorsDb(peaks, range_ms, db, use_index=False):
+    if not isinstance(db, MassDB):
+        db = MassDB.fromDict(db)
+
+    parts = []
+    for start, s in db.segments:
+        index = getMassIndex(s) if use_index else None
+        gs, qs, err = CalcPpmErrors(peaks, range_ms, s.masses, s.offsets, index, s.scale)
+        parts.append((gs + start, qs, err))
+    if len(parts) == 1:
+        gs, qs, err = parts[0]
+    else:
+        gs, qs, err = [np.concatenate([p[i] for p in parts]) for i in range(3)]
+
+    if len(db.dead) > 0:
+        live = ~np.isin(gs, db.dead)
+        gs, qs, err = gs[live], qs[live], err[live]
+
+    return gs, qs, err
@@ -15,51 +15,96 @@ import logging
 import time
 import ntpath
 
+import numpy as np
+
 import GPMsDB_tk
 from GPMsDB_tk.defaultValues import DefaultValues
 
 
-def PeakLoader(inputFile, minimum):
+class PeakList(object):
+    """Peak list parsed once into m/z-sorted float64 arrays.
+
+    intensity holds the last intensity given for each m/z and total the sum
+    over all parsed lines, as the relative intensities have always been
+    computed. The same object can be passed on to PeakParser and PlotPeaks.
+    """
+
+    def __init__(self, mz, intensity, total, com):
+        self.mz = mz
+        self.intensity = intensity
+        self.total = total
+        self.com = com
+
+    def relative(self):
+        return self.intensity / float(self.total)
+
+    def load(self, minimum):
+        rel = self.relative()
+        mask = rel > minimum
+        peaks = dict(zip(self.mz[mask].tolist(), rel[mask].tolist()))
+
+        return peaks, len(self.mz), int(mask.sum()), self.com
+
+
+def parseColumn(tokens, default=None):
+    # fast path through numpy, token by token only for malformed input
+    try:
+        return np.array(tokens, dtype=np.float64), np.ones(len(tokens), dtype=bool)
+    except ValueError:
+        values = np.empty(len(tokens), dtype=np.float64)
+        ok = np.ones(len(tokens), dtype=bool)
+        for n, t in enumerate(tokens):
+            try:
+                values[n] = float(t)
+            except ValueError:
+                values[n] = np.nan if default is None else default
+                ok[n] = False
+        return values, ok
+
+
+def readPeakList(inputFile):
     checkFileExists(inputFile)
 
-    t_peak = 0
-    intens = {}
     com = ''
-    for line in open(inputFile):
-        if "#" in line:
-            continue
-
-        lineSplit = line.split()
-        if lineSplit[0] == '':
-            continue
-        elif 'COM=' in lineSplit[0]:
-            com = lineSplit[0].strip().replace("COM=", "")
-        else:
-            try:
-                peak = float(lineSplit[0])
-            except:
+    rows = []
+    with open(inputFile) as f:
+        for line in f:
+            if "#" in line:
                 continue
-            try:
-                intens[peak] = float(lineSplit[1])
-                t_peak += intens[peak]
-            except:
-                t_peak += 1
-                intens[peak] = 1
-
-    p_use = 0
-    total = 0
-    peaks = {}
-
-    result = sorted(intens.items(), reverse=False)
-    dic = dict(result)
-
-    for x in dic:
-        total += 1
-        if float(intens[x]) / float(t_peak) > minimum:
-            peaks[x] = (intens[x]) / float(t_peak)
-            p_use += 1
-
-    return peaks, total, p_use, com
+            lineSplit = line.split()
+            if len(lineSplit) == 0:
+                continue
+            elif 'COM=' in lineSplit[0]:
+                com = lineSplit[0].strip().replace("COM=", "")
+            else:
+                rows.append(lineSplit)
+
+    mz, ok = parseColumn([r[0] for r in rows])
+    rows = [r for r, k in zip(rows, ok) if k]
+    mz = mz[ok]
+
+    # peaks without a (valid) intensity count as 1
+    intensity = np.ones(len(rows), dtype=np.float64)
+    two = np.flatnonzero([len(r) > 1 for r in rows])
+    if len(two):
+        intensity[two] = parseColumn([rows[n][1] for n in two], default=1)[0]
+
+    return makePeakList(mz, intensity, com)
+
+
+def makePeakList(mz, intensity, com=''):
+    # sequential sum, as in the line-by-line accumulation
+    total = float(np.cumsum(intensity)[-1]) if len(intensity) else 0
+
+    # a repeated m/z keeps its last intensity
+    mz, last = np.unique(mz[::-1], return_index=True)
+    intensity = intensity[::-1][last]
+
+    return PeakList(mz, intensity, total, com)
+
+
+def PeakLoader(inputFile, minimum):
+    return readPeakList(inputFile).load(minimum)
 
 
 def selectDb(ref, tax):
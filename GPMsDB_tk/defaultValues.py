@@ -12,25 +12,32 @@ import os
 import sys
 
 class DefaultValues():
-    try:
-        GENERIC_PATH = os.environ['GPMsDB_PATH']
-    except KeyError:
-        print('  ERROR ')
-        print("The 'GPMsDB_PATH' environment variable is not defined.")
-        print('Please set this variable to your reference data package.' + '\n')
-        sys.exit(1)
+    # checked by checkDataPath() in the commands that use the reference data
+    GENERIC_PATH = os.environ.get('GPMsDB_PATH', '')
 
     NO_THREAD = 4           #number of default threads
+    BATCH_SIZE = 16         #number of peak lists scored together in the batch workflows
+    NO_RENDERER = 2         #number of processes drawing the annotation plots in the batch workflows
+
+    SERVER_HOST = '127.0.0.1'   #address of the identification server
+    SERVER_PORT = 8642          #port of the identification server
 
     CHECK_RANGE = 1000      #range of torelance (ppm) to check
     NO_BIN = 5              #numbert of bins to be tested for given range of ppm.
     TORELANCE = 200         #torelance (ppm)'
+    CALIB_BANDWIDTH = 20    #kernel bandwidth (ppm) of the continuous m/z adjustment
+    CALIB_STEP = 0.1        #resolution (ppm) of the continuous m/z adjustment
 
     MIN_PEAK = 0.0002        #minimum peak relative abundance (0.001 as 0.1%%)'
 
     HIT_RETAIN_FST = 200    #number of hits retained in the 1st screening based on ribosomal proteins
     HIT_SHOW = 20          #number of top hits shown
 
+    RANDOM_SEED = 0         #seed of the random sampling of genomes for the background scores
+    RANDOM_SAMPLE = 400     #number of randomly selected genomes for the background scores
+    BACKGROUND_PEAKS = [10, 25, 50, 75, 100, 150, 200, 300]   #peak counts of the precomputed background table
+    BACKGROUND_REPEATS = 10     #synthetic peak lists per peak count of the background table
+
     HIT_EXCLUDE_REP = 1000    #number of top hits excluded for calculating average scores in representative db
     HIT_EXCLUDE_ALL = 50000    #number of top hits excluded for calculating average scores in all db
     HIT_EXCLUDE_ALL2 = 400    #number of top hits excluded for calculating average scores in all db (2nd criteria)
@@ -59,9 +66,28 @@ class DefaultValues():
     CUSTOM_LIST_GENES = os.path.join(GPMsDB_PATH, 'custom', 'custom_genes.db')
     CUSTOM_LIST_NAME = os.path.join(GPMsDB_PATH, 'custom', 'custom_names.db')
     CUSTOM_LIST_TAX = os.path.join(GPMsDB_PATH, 'custom', 'custom_taxonomy.db')
+
+    MASS_DBS = [REPS_REPS_DB, REPS_ALL_DB, ALL_REPS_DB, ALL_ALL_DB, CUSTOM_LIST_R, CUSTOM_LIST_O]
+    INDEXED_DBS = [REPS_REPS_DB, ALL_REPS_DB, CUSTOM_LIST_R]     #databases used in the 1st search
+    METADATA_DBS = [TAX_NCBI, STRAIN_DB, TAX_GTDB, TAX_GG, TAX_SILVA, CUSTOM_LIST_NAME, CUSTOM_LIST_TAX]
+    INDEX_PPM = 200         #bin width (ppm) of the inverted m/z index
+    BITSET_PPM = 1          #bin width (ppm) of the m/z bitset index (hit counting tolerance of -e bitset)
+    MASS_UNIT = 0.1         #unit (ppm) of the log-m/z scale of int32 mass databases
+    ANNOTATION_CACHE = 256  #number of parsed annotation tables kept per process
+    METADATA_CACHE = 4096   #number of names/taxonomy strings kept per metadata table
+    CACHE_SIZE = 512        #size limit (MB) of the result cache
+    CACHE_ENTRIES = 100000  #number of results kept in the result cache
     
     PROBABIL_RIBOSOMAL = 5
     PROBABIL_REPS_90 = 0.00001
     PROBABIL_REPS_99 = 0.000001
     PROBABIL_ALL_90 =  0.000001
     PROBABIL_ALL_99 =  0.0000001
+
+
+def checkDataPath():
+    if DefaultValues.GENERIC_PATH == '':
+        print('  ERROR ')
+        print("The 'GPMsDB_PATH' environment variable is not defined.")
+        print('Please set this variable to your reference data package.' + '\n')
+        sys.exit(1)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+__author__ = 'Yuji Sekiguchi'
+__copyright__ = 'Copyright (c) 2023 Yuji Sekiguchi, National Institute of Advanced Industrial Science and Technology (AIST)'
+__credits__ = ['Yuji Sekiguchi']
+__license__ = 'GPL3.0'
+__maintainer__ = 'Yuji Sekiguchi'
+__email__ = 'y.sekiguchi@aist.go.jp'
+__status__ = 'Development'
+
+import os
+import sys
+import pickle
+import shutil
+import logging
+
+import numpy as np
+
+from GPMsDB_tk.defaultValues import DefaultValues
+from GPMsDB_tk.massdb import (MassDB, MASS_FILE, REMOVED_FILE, ENTRY_FILE, deltaPath,
+                              deltaSegments, loadDb, columnarPath, writeColumnar, writeIds,
+                              writeMassDb, writeSource)
+from GPMsDB_tk.massindex import MassIndex, buildMassIndex, INDEX_DIR
+from GPMsDB_tk.bitset import BitsetIndex, buildBitsetIndex, BITSET_DIR
+from GPMsDB_tk.metadata import KEY_FILE, writeMetadata
+from GPMsDB_tk.annotation import ANNOTATION_SUFFIX, markUpdated
+
+
+def referenceTables():
+    # tables of the reference data that take delta segments (the custom
+    # tables are rebuilt by GPMsDB-dbtk and are small anyway)
+    return [DefaultValues.REPS_REPS_DB, DefaultValues.REPS_ALL_DB, DefaultValues.ALL_REPS_DB,
+            DefaultValues.ALL_ALL_DB, DefaultValues.REPS_GENE, DefaultValues.ALL_GENE,
+            DefaultValues.TAX_NCBI, DefaultValues.STRAIN_DB, DefaultValues.TAX_GTDB,
+            DefaultValues.TAX_GG, DefaultValues.TAX_SILVA]
+
+
+def appendDelta(db_file, entries, removed=()):
+    # a new delta segment of db_file holding entries (added or replaced
+    # genomes) and the ids of the removed genomes; it is written under a
+    # temporary name and renamed, so readers never see it half written
+    logger = logging.getLogger('GPMsDB_tk')
+
+    root = deltaPath(db_file)
+    os.makedirs(root, exist_ok=True)
+    numbers = [int(os.path.basename(p)) for p in deltaSegments(db_file)]
+    path = os.path.join(root, '%04d' % (max(numbers, default=0) + 1))
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    if db_file in DefaultValues.MASS_DBS:
+        db = MassDB.fromDict(entries)
+        writeMassDb(db, tmp_path)
+        if db_file in DefaultValues.INDEXED_DBS:
+            MassIndex.build(db.masses, db.offsets).save(os.path.join(tmp_path, INDEX_DIR))
+            BitsetIndex.build(db.masses, db.offsets).save(os.path.join(tmp_path, BITSET_DIR))
+    else:
+        with open(os.path.join(tmp_path, ENTRY_FILE), 'wb') as f:
+            pickle.dump(dict(entries), f)
+    writeIds(removed, tmp_path, REMOVED_FILE)
+
+    os.rename(tmp_path, path)
+    logger.info('Delta segment ' + path + ': ' + str(len(entries)) + ' added, ' +
+                str(len(removed)) + ' removed.')
+
+    return path
+
+
+def applyUpdate(update_dir, removed=()):
+    # update_dir holds pickled tables of the new genomes at the same paths
+    # as the reference data (e.g. mass/all.db) and their annotation files
+    # in genomes/; removed genomes are dropped from every table
+    logger = logging.getLogger('GPMsDB_tk')
+
+    n = 0
+    for db_file in referenceTables():
+        update_file = os.path.join(update_dir, os.path.relpath(db_file, DefaultValues.GPMsDB_PATH))
+        entries = {}
+        if os.path.isfile(update_file):
+            with open(update_file, 'rb') as f:
+                entries = pickle.load(f)
+        if len(entries) == 0 and len(removed) == 0:
+            continue
+        if not os.path.isfile(db_file) and not os.path.isdir(columnarPath(db_file)):
+            logger.warning('Reference table not found, update skipped: ' + db_file)
+            continue
+        appendDelta(db_file, entries, removed)
+        n += 1
+
+    genome_dir = os.path.join(update_dir, os.path.basename(DefaultValues.GENOME_DIR))
+    if os.path.isdir(genome_dir):
+        os.makedirs(DefaultValues.GENOME_DIR, exist_ok=True)
+        files = sorted(os.listdir(genome_dir))
+        for f in files:
+            shutil.copy(os.path.join(genome_dir, f), DefaultValues.GENOME_DIR)
+        markUpdated(DefaultValues.GENOME_DIR, [f[:-len(ANNOTATION_SUFFIX)] for f in files
+                                               if f.endswith(ANNOTATION_SUFFIX)])
+        logger.info(str(len(files)) + ' annotation files copied to ' + DefaultValues.GENOME_DIR)
+
+    if n == 0:
+        logger.error('No table of the reference data found in ' + update_dir)
+        sys.exit(1)
+
+    return n
+
+
+def compactDb(db_file):
+    # rewrite db_file with its delta segments merged, in the format it is
+    # read from (columnar databases are indexed again like converted ones)
+    logger = logging.getLogger('GPMsDB_tk')
+
+    segments = deltaSegments(db_file)
+    if len(segments) == 0:
+        return False
+
+    db = loadDb(db_file)
+    path = columnarPath(db_file)
+    if os.path.isdir(path):
+        tmp_path = path + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        if os.path.isfile(os.path.join(path, KEY_FILE)):
+            n = writeMetadata(db, tmp_path)
+        else:
+            # in the mass type of the converted table
+            mass_type = np.load(os.path.join(path, MASS_FILE), mmap_mode='r').dtype.name
+            n = writeColumnar(db, tmp_path, mass_type)[0]
+        del db
+        # read from the pickle when it had changed, so it matches again
+        writeSource(db_file, tmp_path)
+
+        # the deltas are removed last: applied again to the compacted
+        # table after an interruption, they change nothing
+        os.rename(path, path + '.old')
+        os.rename(tmp_path, path)
+        shutil.rmtree(path + '.old')
+        if db_file in DefaultValues.INDEXED_DBS:
+            buildMassIndex(path)
+            buildBitsetIndex(path)
+    else:
+        if db_file in DefaultValues.MASS_DBS:
+            merged = {g: [float(m) for m in db[g]] for g in db}
+        else:
+            merged = dict(db.items())
+        with open(db_file + '.tmp', 'wb') as f:
+            pickle.dump(merged, f)
+        os.replace(db_file + '.tmp', db_file)
+        n = len(merged)
+
+    shutil.rmtree(deltaPath(db_file))
+    logger.info('Compacted ' + db_file + ' (' + str(len(segments)) + ' delta segments, ' +
+                str(n) + ' genomes).')
+
+    return True
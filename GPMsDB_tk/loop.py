@@ -10,7 +10,9 @@ __status__ = 'Development'
 
 import os
 import sys
+import shutil
 import logging
+import tempfile
 import multiprocessing as mp
 
 
@@ -20,7 +22,12 @@ from GPMsDB_tk.peakparser import PeakParser
 from GPMsDB_tk.searchbest import SearchBestHit
 from GPMsDB_tk.searchbest_linear import SearchBestHit2
 from GPMsDB_tk.adjustmz import AdjustMZ
-from GPMsDB_tk.common import PeakLoader, checkFileExistsNoBreak, logger_init, StopWatch
+from GPMsDB_tk.massdb import shareMassDb
+from GPMsDB_tk.calcvec import CalcHitBatch, CalcBitsetBatch
+from GPMsDB_tk.renderer import RendererPool
+from GPMsDB_tk.resultcache import lookupCache, storeCache
+from GPMsDB_tk.common import readPeakList, checkFileExistsNoBreak, logger_init, StopWatch
+from GPMsDB_tk.spectra import readInputList, iterInputs, containerFormat
 
 
 def version():
@@ -34,95 +41,150 @@ class Loop(object):
         self.defaultout = "out"
         self.logger = logging.getLogger('GPMsDB_tk')
 
-    def workerThread(self, queueIn, queueOut, out_dir, auto_adjust, ppm_range, number_of_bins,
+    def workerThread(self, queueIn, queueOut, out_dir, auto_adjust, ppm_range, number_of_bins, calibration,
                      reference, ppm, first, top, score_type, minimum, filetype, tax_adjust,
-                     reps, all, tax, strain, genes, taxonomy, peakdetect):
+                     reps, all, tax, strain, genes, taxonomy, peakdetect, background=None, renderQueue=None,
+                     cache=None, engine='exact'):
         while True:
-            in_file = queueIn.get(block=True, timeout=None)
-            if in_file == None:
+            in_files = queueIn.get(block=True, timeout=None)
+            if in_files == None:
                 break
 
-            basename_without_ext = os.path.splitext(
-                os.path.basename(in_file))[0]
-            out_file = str(basename_without_ext + ".out")
+            # peak loading and m/z adjustment, one log file per peak list
+            batch = []
+            for in_file, peaklist in in_files:
+                basename_without_ext = os.path.splitext(
+                    os.path.basename(in_file))[0]
+                out_file = str(basename_without_ext + ".out")
+
+                logger_init(self.logger, out_dir, filename=out_file, silent=True)
+                stopwatch = StopWatch(self.logger)
+
+                # spectra of containers arrive already read
+                if peaklist is None:
+                    a = checkFileExistsNoBreak(in_file)
+                    if a == "1":
+                        self.logger.handlers.clear()
+                        queueOut.put(in_file)
+                        continue
+
+                    peaklist = readPeakList(in_file)
+                peaks, t_peak, p_use, com = peaklist.load(minimum)
+
+                if len(list(peaks)) == 0:
+                    self.logger.error("No peaks found for " + str(in_file))
+                    self.logger.handlers.clear()
+                    queueOut.put(in_file)
+                    continue
+
+                list_peaks = []
+                for i in peaks.keys():
+                    list_peaks.append(i)
+
+                # peak lists searched before skip the adjustment and search
+                key, cached = lookupCache(cache, list_peaks, t_peak, p_use, com)
+                if cached is not None:
+                    self.logger.info('[identify] Search result found in the cache.')
+                    adjust = cached['summary']['adjust']
+                else:
+                    p = AdjustMZ()
+                    if auto_adjust == True:
+                        adjust = p.run(list_peaks,
+                                       ppm_range,
+                                       number_of_bins,
+                                       reps,
+                                       tax_adjust,
+                                       calibration,
+                                       engine)
+                    else:
+                        adjust = 0
 
-            logger_init(self.logger, out_dir, filename=out_file, silent=True)
-            stopwatch = StopWatch(self.logger)
+                stopwatch.lap()
 
-            a = checkFileExistsNoBreak(in_file)
-            if a == "1":
+                batch.append((in_file, peaklist, list_peaks, t_peak, p_use, com, adjust,
+                              list(self.logger.handlers), stopwatch, key, cached))
                 self.logger.handlers.clear()
-                queueOut.put(in_file)
-                continue
 
-            peaks, t_peak, p_use, com = PeakLoader(in_file, minimum)
-
-            if len(list(peaks)) == 0:
-                self.logger.error("No peaks found for " + str(in_file))
-                self.logger.handlers.clear()
-                queueOut.put(in_file)
-                continue
-
-            list_peaks = []
-            for i in peaks.keys():
-                list_peaks.append(i)
-
-            p = AdjustMZ()
-            if auto_adjust == True:
-                adjust = p.run(list_peaks,
-                               ppm_range,
-                               number_of_bins,
-                               reps,
-                               tax_adjust)
-            else:
-                adjust = 0
-
-            stopwatch.lap()
-
-            p = SearchBestHit()
-
-            best = p.run(in_file,
-                         reference,
-                         list_peaks,
-                         ppm,
-                         first,
-                         top,
-                         score_type,
-                         adjust,
-                         reps,
-                         all,
-                         tax,
-                         tax_adjust,
-                         strain,
-                         com,
-                         genes,
-                         taxonomy,
-                         t_peak,
-                         p_use,
-                         minimum)
-
-            stopwatch.lap()
-
-            db = DefaultValues.GENOME_DIR
-
-            if peakdetect == "yes":
-                p = PeakParser()
-                p.run(in_file,
-                      reference,
-                      out_dir,
-                      ppm,
-                      best,
-                      adjust,
-                      filetype,
-                      db)
+            # 1st search of the whole batch in a single pass over reps
+            todo = [n for n, b in enumerate(batch) if b[10] is None]
+            first_hits = {}
+            if len(todo) > 0 and engine == 'bitset' and score_type != 'ms':
+                hits, exact = CalcBitsetBatch(self,
+                                              [batch[n][2] for n in todo],
+                                              [batch[n][6] for n in todo],
+                                              ppm,
+                                              1,
+                                              reps)
+                first_hits = dict(zip(todo, zip(hits, exact)))
+            elif len(todo) > 0:
+                hits, exact = CalcHitBatch(self,
+                                           [batch[n][2] for n in todo],
+                                           [batch[n][6] for n in todo],
+                                           ppm,
+                                           1,
+                                           reps,
+                                           score_type,
+                                           use_index=True)
+                first_hits = dict(zip(todo, zip(hits, exact)))
+
+            for n, (in_file, peaklist, list_peaks, t_peak, p_use, com, adjust, handlers, stopwatch, key, cached) in enumerate(batch):
+                self.logger.handlers.extend(handlers)
+
+                p = SearchBestHit()
+
+                if cached is not None:
+                    best = p.replay(in_file, cached)
+                else:
+                    best = p.run(in_file,
+                                 reference,
+                                 list_peaks,
+                                 ppm,
+                                 first,
+                                 top,
+                                 score_type,
+                                 adjust,
+                                 reps,
+                                 all,
+                                 tax,
+                                 tax_adjust,
+                                 strain,
+                                 com,
+                                 genes,
+                                 taxonomy,
+                                 t_peak,
+                                 p_use,
+                                 minimum,
+                                 first_hits[n],
+                                 background,
+                                 engine)
+                    storeCache(cache, key, p)
 
                 stopwatch.lap()
-            else:
-                pass
 
-            self.logger.handlers.clear()
+                db = DefaultValues.GENOME_DIR
+
+                if peakdetect == "yes":
+                    p = PeakParser()
+                    p.run(in_file,
+                          reference,
+                          out_dir,
+                          ppm,
+                          best,
+                          adjust,
+                          filetype,
+                          db,
+                          peaklist,
+                          renderQueue)
+
+                    stopwatch.lap()
+                else:
+                    pass
+
+                for h in handlers:
+                    h.close()
+                self.logger.handlers.clear()
 
-            queueOut.put(in_file)
+                queueOut.put(in_file)
 
     def writerThread(self, numDataItems, writerQueue):
         #print("writerThread")
@@ -133,58 +195,94 @@ class Loop(object):
                 break
 
             processedItems += 1
-            statusStr = 'Finished processing %d of %d (%.2f%%) items.' % (
-                processedItems, numDataItems, float(processedItems) * 100 / numDataItems)
+            if numDataItems is None:
+                statusStr = 'Finished processing %d items.' % processedItems
+            else:
+                statusStr = 'Finished processing %d of %d (%.2f%%) items.' % (
+                    processedItems, numDataItems, float(processedItems) * 100 / numDataItems)
             sys.stdout.write('%s\r' % statusStr)
         sys.stdout.flush()
         sys.stdout.write('\n')
 
-    def run(self, input_list, out_dir, auto_adjust, ppm_range, number_of_bins,
+    def run(self, input_list, out_dir, auto_adjust, ppm_range, number_of_bins, calibration,
             reference, ppm, first, top, score_type, core, minimum, filetype,
-            tax_adjust, reps, all, tax, strain, genes, taxonomy, peakdetect):
-
-        peaklist_files = []
-        for line in open(input_list, encoding='utf-8'):
-            if line.startswith("#"):
-                continue
-            elif line == "":
-                continue
-
-            element = line.split("\t")
-            peaklist_files.append(element[0].strip())
-
-        print('  Number of unprocessed peak lists: %d' % len(peaklist_files))
+            tax_adjust, reps, all, tax, strain, genes, taxonomy, peakdetect, background=None, cache=None,
+            engine='exact'):
+
+        peaklist_files = readInputList(input_list)
+
+        # the number of spectra in containers is known only once they are read
+        containers = [f for f in peaklist_files if containerFormat(f) is not None]
+        if len(containers) == 0:
+            numDataItems = len(peaklist_files)
+            print('  Number of unprocessed peak lists: %d' % numDataItems)
+        else:
+            numDataItems = None
+            print('  Number of unprocessed peak lists: %d (and the spectra of %d containers)' % (
+                len(peaklist_files) - len(containers), len(containers)))
         if not os.path.exists(out_dir):
             os.mkdir(out_dir)
 
-        workerQueue = mp.Queue()
+        # reference masses are handed to the workers as read-only memory maps
+        tmp_dir = tempfile.mkdtemp(prefix='GPMsDB_tk_')
+        reps = shareMassDb(reps, tmp_dir, index=True, bitset=engine == 'bitset')
+        all = shareMassDb(all, tmp_dir)
+
+        # spectra are streamed to the workers while the inputs are read, so
+        # the queue is bounded to a few batches per worker
+        workerQueue = mp.Queue(maxsize=2 * core)
         writerQueue = mp.Queue()
 
-        for f in peaklist_files:
-            workerQueue.put(f)
+        # peak lists are handed out in batches that share one 1st search
+        if numDataItems is None:
+            size = DefaultValues.BATCH_SIZE
+        else:
+            size = max(1, min(DefaultValues.BATCH_SIZE, -(-numDataItems // core)))
 
-        for _ in range(core):
-            workerQueue.put(None)
+        # annotation plots are drawn by separate processes off the search path
+        renderers = None
+        if peakdetect == "yes":
+            renderers = RendererPool(min(core, DefaultValues.NO_RENDERER))
+        renderQueue = renderers.queue if renderers is not None else None
 
         try:
             workerProc = [mp.Process(target=self.workerThread, args=(workerQueue, writerQueue,
-                                                                     out_dir, auto_adjust, ppm_range, number_of_bins, reference, ppm, first, top, score_type, minimum, filetype,
-                                                                     tax_adjust, reps, all, tax, strain, genes, taxonomy, peakdetect)) for _ in range(core)]
+                                                                     out_dir, auto_adjust, ppm_range, number_of_bins, calibration, reference, ppm, first, top, score_type, minimum, filetype,
+                                                                     tax_adjust, reps, all, tax, strain, genes, taxonomy, peakdetect, background, renderQueue, cache, engine)) for _ in range(core)]
             writeProc = mp.Process(target=self.writerThread, args=(
-                len(peaklist_files), writerQueue))
+                numDataItems, writerQueue))
 
             writeProc.start()
 
             for p in workerProc:
                 p.start()
 
+            batch = []
+            for item in iterInputs(peaklist_files):
+                batch.append(item)
+                if len(batch) == size:
+                    workerQueue.put(batch)
+                    batch = []
+            if len(batch) > 0:
+                workerQueue.put(batch)
+
+            for _ in range(core):
+                workerQueue.put(None)
+
             for p in workerProc:
                 p.join()
 
             writerQueue.put(None)
             writeProc.join()
+
+            if renderers is not None:
+                renderers.close()
         except:
             for p in workerProc:
                 p.terminate()
 
             writeProc.terminate()
+            if renderers is not None:
+                renderers.terminate()
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
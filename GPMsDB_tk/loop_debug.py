@@ -10,15 +10,21 @@ __status__ = 'Development'
 
 import os
 import sys
+import shutil
 import logging
+import tempfile
 import multiprocessing as mp
 
+import numpy as np
+
 from GPMsDB_tk import __version__
 from GPMsDB_tk.defaultValues import DefaultValues
 from GPMsDB_tk.peakparser import PeakParser
 from GPMsDB_tk.searchbest_linear import SearchBestHit2
 from GPMsDB_tk.common import PeakLoader
 from GPMsDB_tk.adjustmz import AdjustMZ
+from GPMsDB_tk.massdb import shareMassDb
+from GPMsDB_tk.calcvec import TopIndices
 from GPMsDB_tk.common import makeSurePathExists, checkFileExists, checkFileExistsNoBreak
 
 
@@ -32,7 +38,7 @@ class Loop2(object):
       self.defaultout = "out"
       self.logger = logging.getLogger('GPMsDB_tk')
 
-  def __workerThread(self, queueIn, queueOut, out_dir, auto_adjust, ppm_range, number_of_bins,
+  def __workerThread(self, queueIn, queueOut, out_dir, auto_adjust, ppm_range, number_of_bins, calibration,
                      reference, ppm, score_type, minimum, tax_adjust, reps, all, genes, no_gen, tax):
       while True:
             in_file = queueIn.get(block=True, timeout=None)
@@ -64,7 +70,8 @@ class Loop2(object):
                         ppm_range,
                         number_of_bins,
                         reps,
-                        tax_adjust)
+                        tax_adjust,
+                        calibration)
             else:
                 adjust = 0
 
@@ -88,12 +95,13 @@ class Loop2(object):
                      minimum,
                      no_gen)
 
-            result = sorted(scores.items(), key=lambda x:x[1], reverse=True)[:int(10)]
-            dic = dict(result)
+            valid = np.flatnonzero(~np.isnan(scores))
+            result = valid[TopIndices(scores[valid], 10)]
 
             with open(outfile, mode='w') as f:
-                for n in dic:
-                    f.write(n + "\t" + str(scores[n]) + "\t" + tax[n] + "\n")
+                for i in result:
+                    n = all.ids[i]
+                    f.write(n + "\t" + str(float(scores[i])) + "\t" + tax[n] + "\n")
 
             queueOut.put(in_file)
 
@@ -110,7 +118,7 @@ class Loop2(object):
       sys.stdout.flush()
       sys.stdout.write('\n')
 
-  def run(self, input_list, out_dir, auto_adjust, ppm_range, number_of_bins,
+  def run(self, input_list, out_dir, auto_adjust, ppm_range, number_of_bins, calibration,
           reference, ppm, score_type, core, minimum, tax_adjust, reps, all,
           genes, no_gen, tax):
 
@@ -128,6 +136,11 @@ class Loop2(object):
       if not os.path.exists(out_dir):
           os.mkdir(out_dir)
 
+      # reference masses are handed to the workers as read-only memory maps
+      tmp_dir = tempfile.mkdtemp(prefix='GPMsDB_tk_')
+      reps = shareMassDb(reps, tmp_dir)
+      all = shareMassDb(all, tmp_dir)
+
       workerQueue = mp.Queue()
       writerQueue = mp.Queue()
 
@@ -139,7 +152,7 @@ class Loop2(object):
 
       try:
         workerProc = [mp.Process(target = self.__workerThread, args = (workerQueue, writerQueue,
-           out_dir, auto_adjust, ppm_range, number_of_bins, reference, ppm, score_type, minimum,
+           out_dir, auto_adjust, ppm_range, number_of_bins, calibration, reference, ppm, score_type, minimum,
            tax_adjust, reps, all, genes, no_gen, tax)) for _ in range(core)]
         writeProc = mp.Process(target = self.__writerThread, args = (len(peaklist_files), writerQueue))
 
@@ -158,3 +171,5 @@ class Loop2(object):
           p.terminate()
 
         writeProc.terminate()
+      finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
@@ -10,20 +10,30 @@ __status__ = 'Development'
 
 import sys
 import os
+import json
 import logging
-import pickle
 import time
 
-from GPMsDB_tk.common import (selectDb, PeakLoader,
+from GPMsDB_tk.common import (PeakLoader, readPeakList,
                               makeSurePathExists, checkFileExists,
-                              checkEmptyDir)
-from GPMsDB_tk.defaultValues import DefaultValues
+                              checkFileExistsNoBreak, checkEmptyDir, checkDirExists)
+from GPMsDB_tk.defaultValues import DefaultValues, checkDataPath
 from GPMsDB_tk.adjustmz import AdjustMZ
 from GPMsDB_tk.loop import Loop
 from GPMsDB_tk.loop_debug import Loop2
+from GPMsDB_tk.massdb import convertMassDb
+from GPMsDB_tk.metadata import convertMetadata
+from GPMsDB_tk.delta import applyUpdate, compactDb, referenceTables
+from GPMsDB_tk.massindex import buildMassIndex, INDEX_DIR
+from GPMsDB_tk.bitset import buildBitsetIndex, BITSET_DIR
+from GPMsDB_tk.annotation import convertAnnotations, compactAnnotations
+from GPMsDB_tk.bundle import DatabaseBundle
+from GPMsDB_tk.resultcache import openCache, lookupCache, storeCache
+from GPMsDB_tk.background import Background, loadBackground, buildBackground
 from GPMsDB_tk.peakparser import PeakParser
 from GPMsDB_tk.plot_peaks import PlotPeaks
 from GPMsDB_tk.searchbest import SearchBestHit
+from GPMsDB_tk.server import IdentifyServer, requestServer
 from GPMsDB_tk.common import StopWatch, logger_init
 
 
@@ -65,22 +75,25 @@ class OptionsParser():
             list_peaks.append(i)
 
         self.logger.info('[adjust] Loading databases.')
-        reps_db = DefaultValues.REPS_REPS_DB
-        tax_db = DefaultValues.TAX_NCBI
-        with open(reps_db, 'rb') as f:
-            reps = pickle.load(f)
-        with open(tax_db, 'rb') as f:
-            tax = pickle.load(f)
+        bundle = DatabaseBundle('reps', 'ncbi')
 
         p = AdjustMZ()
         p.run(list_peaks,
               options.ppm_range,
               options.number_of_bins,
-              reps,
-              tax)
+              bundle.reps,
+              bundle.ncbi,
+              options.calibration,
+              options.engine)
 
         self.stopwatch.lap()
 
+    def selectBackground(self, options, bundle):
+        if options.background == 'table':
+            return loadBackground(options.reference, bundle.reps, options.seed)
+
+        return Background(options.seed)
+
     def identify(self, options):
         logger_init(self.logger, None, silent=options.silent)
         self.logger.info(
@@ -97,47 +110,20 @@ class OptionsParser():
         for i in peaks.keys():
             list_peaks.append(i)
 
+        bundle = DatabaseBundle(options.reference, options.taxonomy)
+        cache = openCache(options, bundle)
+        key, cached = lookupCache(cache, list_peaks, t_peak, p_use, com)
+        if cached is not None:
+            self.logger.info('[identify] Search result found in the cache.')
+            p = SearchBestHit()
+            p.replay(options.input_file, cached)
+
+            self.stopwatch.lap()
+            return
+
         self.logger.info('[identify] Loading databases.')
-        tax_db, reps_db, all_db, strain_list, no_genes = selectDb(
-            options.reference, options.taxonomy)
-
-        ncbi_db = DefaultValues.TAX_NCBI
-        with open(ncbi_db, 'rb') as f:
-            ncbi = pickle.load(f)
-        with open(reps_db, 'rb') as f:
-            reps = pickle.load(f)
-        with open(all_db, 'rb') as f:
-            all = pickle.load(f)
-        with open(tax_db, 'rb') as f:
-            tax = pickle.load(f)
-        with open(strain_list, 'rb') as f:
-            strain = pickle.load(f)
-        with open(no_genes, 'rb') as f:
-            genes = pickle.load(f)
-
-        if options.reference == 'custom':
-            db_rep_c = DefaultValues.CUSTOM_LIST_R
-            db_all_c = DefaultValues.CUSTOM_LIST_O
-            no_genes_c = DefaultValues.CUSTOM_LIST_GENES
-            strain_list_c = DefaultValues.CUSTOM_LIST_NAME
-            tax_db_c = DefaultValues.CUSTOM_LIST_TAX
-            with open(strain_list_c, 'rb') as f:
-                ncbi_c = pickle.load(f)
-            with open(db_rep_c, 'rb') as f:
-                reps_c = pickle.load(f)
-            with open(db_all_c, 'rb') as f:
-                all_c = pickle.load(f)
-            with open(tax_db_c, 'rb') as f:
-                tax_c = pickle.load(f)
-            with open(strain_list_c, 'rb') as f:
-                strain_c = pickle.load(f)
-            with open(no_genes_c, 'rb') as f:
-                genes_c = pickle.load(f)
-            ncbi.update(ncbi_c)
-            reps.update(reps_c)
-            all.update(all_c)
-            tax.update(tax_c)
-            genes.update(genes_c)
+        bundle.prefetch('reps', 'all', 'tax', 'ncbi', 'strain', 'genes')
+        background = self.selectBackground(options, bundle)
 
         p = SearchBestHit()
         p.run(options.input_file,
@@ -148,17 +134,20 @@ class OptionsParser():
               options.top,
               options.score_type,
               options.adjust,
-              reps,
-              all,
-              tax,
-              ncbi,
-              strain,
+              bundle.reps,
+              bundle.all,
+              bundle.tax,
+              bundle.ncbi,
+              bundle.strain,
               com,
-              genes,
+              bundle.genes,
               options.taxonomy,
               t_peak,
               p_use,
-              options.minimum)
+              options.minimum,
+              background=background,
+              engine=options.engine)
+        storeCache(cache, key, p)
 
         self.stopwatch.lap()
 
@@ -178,62 +167,38 @@ class OptionsParser():
         for i in peaks.keys():
             list_peaks.append(i)
 
+        bundle = DatabaseBundle(options.reference, options.taxonomy)
+        cache = openCache(options, bundle)
+        key, cached = lookupCache(cache, list_peaks, t_peak, p_use, com)
+        if cached is not None:
+            self.logger.info('[identify_wf] Search result found in the cache.')
+            p = SearchBestHit()
+            p.replay(options.input_file, cached)
+
+            self.stopwatch.lap()
+            return
+
+        # the tables of the 2nd search load while the m/z adjustment runs on
+        # the ribosomal set
         self.logger.info('[identify_wf] Loading databases.')
-        reps_db = DefaultValues.REPS_REPS_DB
-        tax_db = DefaultValues.TAX_NCBI
-        with open(reps_db, 'rb') as f:
-            reps = pickle.load(f)
-        with open(tax_db, 'rb') as f:
-            tax_adjust = pickle.load(f)
-
-        tax_db, reps_db, all_db, strain_list, no_genes = selectDb(
-            options.reference, options.taxonomy)
-
-        with open(reps_db, 'rb') as f:
-            reps = pickle.load(f)
-        with open(all_db, 'rb') as f:
-            all = pickle.load(f)
-        with open(tax_db, 'rb') as f:
-            tax = pickle.load(f)
-        with open(strain_list, 'rb') as f:
-            strain = pickle.load(f)
-        with open(no_genes, 'rb') as f:
-            genes = pickle.load(f)
-
-        if options.reference == 'custom':
-            db_rep_c = DefaultValues.CUSTOM_LIST_R
-            db_all_c = DefaultValues.CUSTOM_LIST_O
-            no_genes_c = DefaultValues.CUSTOM_LIST_GENES
-            strain_list_c = DefaultValues.CUSTOM_LIST_NAME
-            tax_db_c = DefaultValues.CUSTOM_LIST_TAX
-            with open(db_rep_c, 'rb') as f:
-                reps_c = pickle.load(f)
-            with open(db_all_c, 'rb') as f:
-                all_c = pickle.load(f)
-            with open(tax_db_c, 'rb') as f:
-                tax_c = pickle.load(f)
-            with open(strain_list_c, 'rb') as f:
-                strain_c = pickle.load(f)
-            with open(no_genes_c, 'rb') as f:
-                genes_c = pickle.load(f)
-            reps.update(reps_c)
-            all.update(all_c)
-            tax.update(tax_c)
-            tax_adjust.update(strain_c)
-            genes.update(genes_c)
+        bundle.prefetch('reps', 'ncbi', 'all', 'tax', 'strain', 'genes')
 
         p = AdjustMZ()
         if options.auto_adjust == True:
             adjust = p.run(list_peaks,
                            options.ppm_range,
                            options.number_of_bins,
-                           reps,
-                           tax_adjust)
+                           bundle.reps,
+                           bundle.ncbi,
+                           options.calibration,
+                           options.engine)
 
             self.stopwatch.lap()
         else:
             adjust = options.adjust
 
+        background = self.selectBackground(options, bundle)
+
         p = SearchBestHit()
         p.run(options.input_file,
               options.reference,
@@ -243,17 +208,20 @@ class OptionsParser():
               options.top,
               options.score_type,
               adjust,
-              reps,
-              all,
-              tax,
-              tax_adjust,
-              strain,
+              bundle.reps,
+              bundle.all,
+              bundle.tax,
+              bundle.ncbi,
+              bundle.strain,
               com,
-              genes,
+              bundle.genes,
               options.taxonomy,
               t_peak,
               p_use,
-              options.minimum)
+              options.minimum,
+              background=background,
+              engine=options.engine)
+        storeCache(cache, key, p)
 
         self.stopwatch.lap()
 
@@ -271,57 +239,20 @@ class OptionsParser():
         cnvtime = time.strptime(now)
         print(time.strftime(
             "[%Y-%m-%d %H:%M:%S][identify_bwf] Loading databases.", cnvtime))
-        reps_db = DefaultValues.REPS_REPS_DB
-        tax_db = DefaultValues.TAX_NCBI
-        with open(reps_db, 'rb') as f:
-            reps = pickle.load(f)
-        with open(tax_db, 'rb') as f:
-            tax_adjust = pickle.load(f)
-
-        tax_db, reps_db, all_db, strain_list, no_genes = selectDb(
-            options.reference, options.taxonomy)
-
-        with open(reps_db, 'rb') as f:
-            reps = pickle.load(f)
-        with open(all_db, 'rb') as f:
-            all = pickle.load(f)
-        with open(tax_db, 'rb') as f:
-            tax = pickle.load(f)
-        with open(strain_list, 'rb') as f:
-            strain = pickle.load(f)
-        with open(no_genes, 'rb') as f:
-            genes = pickle.load(f)
-
-        if options.reference == 'custom':
-            db_rep_c = DefaultValues.CUSTOM_LIST_R
-            db_all_c = DefaultValues.CUSTOM_LIST_O
-            no_genes_c = DefaultValues.CUSTOM_LIST_GENES
-            strain_list_c = DefaultValues.CUSTOM_LIST_NAME
-            tax_db_c = DefaultValues.CUSTOM_LIST_TAX
-            with open(db_rep_c, 'rb') as f:
-                reps_c = pickle.load(f)
-            with open(db_all_c, 'rb') as f:
-                all_c = pickle.load(f)
-            with open(tax_db_c, 'rb') as f:
-                tax_c = pickle.load(f)
-            with open(strain_list_c, 'rb') as f:
-                strain_c = pickle.load(f)
-            with open(no_genes_c, 'rb') as f:
-                genes_c = pickle.load(f)
-            reps.update(reps_c)
-            all.update(all_c)
-            tax.update(tax_c)
-            tax_adjust.update(strain_c)
-            genes.update(genes_c)
+        bundle = DatabaseBundle(options.reference, options.taxonomy)
+        bundle.prefetch('reps', 'all', 'tax', 'ncbi', 'strain', 'genes')
 
         peakdetect = "no"
         filetype = "pdf"
+        background = self.selectBackground(options, bundle)
+
         p = Loop()
         p.run(options.input_list,
               options.out_dir,
               options.auto_adjust,
               options.ppm_range,
               options.number_of_bins,
+              options.calibration,
               options.reference,
               options.ppm,
               options.first,
@@ -330,14 +261,17 @@ class OptionsParser():
               options.core,
               options.minimum,
               filetype,
-              tax_adjust,
-              reps,
-              all,
-              tax,
-              strain,
-              genes,
+              bundle.ncbi,
+              bundle.reps,
+              bundle.all,
+              bundle.tax,
+              bundle.strain,
+              bundle.genes,
               options.taxonomy,
-              peakdetect)
+              peakdetect,
+              background,
+              openCache(options, bundle),
+              options.engine)
 
         now = time.ctime()
         cnvtime = time.strptime(now)
@@ -374,8 +308,8 @@ class OptionsParser():
         checkFileExists(options.input_file)
         makeSurePathExists(options.out_dir)
 
-        peaks, t_peak, p_use, com = PeakLoader(
-            options.input_file, options.minimum)
+        peaklist = readPeakList(options.input_file)
+        peaks, t_peak, p_use, com = peaklist.load(options.minimum)
         if len(list(peaks)) == 0:
             self.logger.error('Peaks not found.')
             sys.exit(1)
@@ -384,82 +318,59 @@ class OptionsParser():
         for i in peaks.keys():
             list_peaks.append(i)
 
-        self.logger.info('[peak_wf] Loading databases.')
-        reps_db = DefaultValues.REPS_REPS_DB
-        ncbi = DefaultValues.TAX_NCBI
-        with open(reps_db, 'rb') as f:
-            reps = pickle.load(f)
-        with open(ncbi, 'rb') as f:
-            tax_adjust = pickle.load(f)
-
-        tax_db, reps_db, all_db, strain_list, no_genes = selectDb(
-            options.reference, options.taxonomy)
-
-        with open(reps_db, 'rb') as f:
-            reps = pickle.load(f)
-        with open(all_db, 'rb') as f:
-            all = pickle.load(f)
-        with open(tax_db, 'rb') as f:
-            tax = pickle.load(f)
-        with open(strain_list, 'rb') as f:
-            strain = pickle.load(f)
-        with open(no_genes, 'rb') as f:
-            genes = pickle.load(f)
-
-        if options.reference == 'custom':
-            db_rep_c = DefaultValues.CUSTOM_LIST_R
-            db_all_c = DefaultValues.CUSTOM_LIST_O
-            no_genes_c = DefaultValues.CUSTOM_LIST_GENES
-            strain_list_c = DefaultValues.CUSTOM_LIST_NAME
-            tax_db_c = DefaultValues.CUSTOM_LIST_TAX
-            with open(db_rep_c, 'rb') as f:
-                reps_c = pickle.load(f)
-            with open(db_all_c, 'rb') as f:
-                all_c = pickle.load(f)
-            with open(tax_db_c, 'rb') as f:
-                tax_c = pickle.load(f)
-            with open(strain_list_c, 'rb') as f:
-                strain_c = pickle.load(f)
-            with open(no_genes_c, 'rb') as f:
-                genes_c = pickle.load(f)
-            reps.update(reps_c)
-            all.update(all_c)
-            tax.update(tax_c)
-            tax_adjust.update(strain_c)
-            genes.update(genes_c)
-
-        p = AdjustMZ()
-        if options.auto_adjust == True:
-            adjust = p.run(list_peaks,
-                           options.ppm_range,
-                           options.number_of_bins,
-                           reps,
-                           tax_adjust)
-
-            self.stopwatch.lap()
+        bundle = DatabaseBundle(options.reference, options.taxonomy)
+        cache = openCache(options, bundle)
+        key, cached = lookupCache(cache, list_peaks, t_peak, p_use, com)
+        if cached is not None:
+            self.logger.info('[peak_wf] Search result found in the cache.')
+            p = SearchBestHit()
+            best = p.replay(options.input_file, cached)
+            adjust = p.summary['adjust']
         else:
-            adjust = options.adjust
-
-        p = SearchBestHit()
-        best = p.run(options.input_file,
-                     options.reference,
-                     list_peaks,
-                     options.ppm,
-                     options.first,
-                     options.top,
-                     options.score_type,
-                     adjust,
-                     reps,
-                     all,
-                     tax,
-                     tax_adjust,
-                     strain,
-                     com,
-                     genes,
-                     options.taxonomy,
-                     t_peak,
-                     p_use,
-                     options.minimum)
+            # the tables of the 2nd search load while the m/z adjustment runs
+            # on the ribosomal set
+            self.logger.info('[peak_wf] Loading databases.')
+            bundle.prefetch('reps', 'ncbi', 'all', 'tax', 'strain', 'genes')
+
+            p = AdjustMZ()
+            if options.auto_adjust == True:
+                adjust = p.run(list_peaks,
+                               options.ppm_range,
+                               options.number_of_bins,
+                               bundle.reps,
+                               bundle.ncbi,
+                               options.calibration,
+                               options.engine)
+
+                self.stopwatch.lap()
+            else:
+                adjust = options.adjust
+
+            background = self.selectBackground(options, bundle)
+
+            p = SearchBestHit()
+            best = p.run(options.input_file,
+                         options.reference,
+                         list_peaks,
+                         options.ppm,
+                         options.first,
+                         options.top,
+                         options.score_type,
+                         adjust,
+                         bundle.reps,
+                         bundle.all,
+                         bundle.tax,
+                         bundle.ncbi,
+                         bundle.strain,
+                         com,
+                         bundle.genes,
+                         options.taxonomy,
+                         t_peak,
+                         p_use,
+                         options.minimum,
+                         background=background,
+                         engine=options.engine)
+            storeCache(cache, key, p)
 
         self.stopwatch.lap()
 
@@ -473,7 +384,8 @@ class OptionsParser():
               best,
               adjust,
               options.filetype,
-              db)
+              db,
+              peaklist)
 
         self.stopwatch.lap()
 
@@ -491,50 +403,11 @@ class OptionsParser():
         cnvtime = time.strptime(now)
         print(time.strftime(
             "[%Y-%m-%d %H:%M:%S][peak_bwf] Loading databases.", cnvtime))
-        reps_db = DefaultValues.REPS_REPS_DB
-        tax_db = DefaultValues.TAX_NCBI
-        with open(reps_db, 'rb') as f:
-            reps = pickle.load(f)
-        with open(tax_db, 'rb') as f:
-            tax_adjust = pickle.load(f)
-
-        tax_db, reps_db, all_db, strain_list, no_genes = selectDb(
-            options.reference, options.taxonomy)
-
-        with open(reps_db, 'rb') as f:
-            reps = pickle.load(f)
-        with open(all_db, 'rb') as f:
-            all = pickle.load(f)
-        with open(tax_db, 'rb') as f:
-            tax = pickle.load(f)
-        with open(strain_list, 'rb') as f:
-            strain = pickle.load(f)
-        with open(no_genes, 'rb') as f:
-            genes = pickle.load(f)
-
-        if options.reference == 'custom':
-            db_rep_c = DefaultValues.CUSTOM_LIST_R
-            db_all_c = DefaultValues.CUSTOM_LIST_O
-            no_genes_c = DefaultValues.CUSTOM_LIST_GENES
-            strain_list_c = DefaultValues.CUSTOM_LIST_NAME
-            tax_db_c = DefaultValues.CUSTOM_LIST_TAX
-            with open(db_rep_c, 'rb') as f:
-                reps_c = pickle.load(f)
-            with open(db_all_c, 'rb') as f:
-                all_c = pickle.load(f)
-            with open(tax_db_c, 'rb') as f:
-                tax_c = pickle.load(f)
-            with open(strain_list_c, 'rb') as f:
-                strain_c = pickle.load(f)
-            with open(no_genes_c, 'rb') as f:
-                genes_c = pickle.load(f)
-            reps.update(reps_c)
-            all.update(all_c)
-            tax.update(tax_c)
-            tax_adjust.update(strain_c)
-            genes.update(genes_c)
+        bundle = DatabaseBundle(options.reference, options.taxonomy)
+        bundle.prefetch('reps', 'all', 'tax', 'ncbi', 'strain', 'genes')
 
         peakdetect = "yes"
+        background = self.selectBackground(options, bundle)
 
         p = Loop()
         p.run(options.input_list,
@@ -542,6 +415,7 @@ class OptionsParser():
               options.auto_adjust,
               options.ppm_range,
               options.number_of_bins,
+              options.calibration,
               options.reference,
               options.ppm,
               options.first,
@@ -550,14 +424,17 @@ class OptionsParser():
               options.core,
               options.minimum,
               options.filetype,
-              tax_adjust,
-              reps,
-              all,
-              tax,
-              strain,
-              genes,
+              bundle.ncbi,
+              bundle.reps,
+              bundle.all,
+              bundle.tax,
+              bundle.strain,
+              bundle.genes,
               options.taxonomy,
-              peakdetect)
+              peakdetect,
+              background,
+              openCache(options, bundle),
+              options.engine)
 
         now = time.ctime()
         cnvtime = time.strptime(now)
@@ -578,38 +455,8 @@ class OptionsParser():
         cnvtime = time.strptime(now)
         print(time.strftime(
             "[%Y-%m-%d %H:%M:%S][debugging] Loading databases.", cnvtime))
-        reps_db = DefaultValues.REPS_REPS_DB
-        tax_db = DefaultValues.TAX_NCBI
-        with open(reps_db, 'rb') as f:
-            reps = pickle.load(f)
-        with open(tax_db, 'rb') as f:
-            tax_adjust = pickle.load(f)
-
-        tax_db, reps_db, all_db, strain_list, no_genes = selectDb(
-            options.reference, 'gtdb')
-
-        with open(reps_db, 'rb') as f:
-            reps = pickle.load(f)
-        with open(all_db, 'rb') as f:
-            all = pickle.load(f)
-        with open(no_genes, 'rb') as f:
-            genes = pickle.load(f)
-        with open(tax_db, 'rb') as f:
-            tax = pickle.load(f)
-
-        if options.reference == 'custom':
-            db_rep_c = DefaultValues.CUSTOM_LIST_R
-            db_all_c = DefaultValues.CUSTOM_LIST_O
-            no_genes_c = DefaultValues.CUSTOM_LIST_GENES
-            with open(db_rep_c, 'rb') as f:
-                reps_c = pickle.load(f)
-            with open(db_all_c, 'rb') as f:
-                all_c = pickle.load(f)
-            with open(no_genes_c, 'rb') as f:
-                genes_c = pickle.load(f)
-            reps.update(reps_c)
-            all.update(all_c)
-            genes.update(genes_c)
+        bundle = DatabaseBundle(options.reference, 'gtdb')
+        bundle.prefetch('reps', 'all', 'genes', 'tax', 'ncbi')
 
         p = Loop2()
         p.run(options.input_list,
@@ -617,26 +464,150 @@ class OptionsParser():
               options.auto_adjust,
               options.ppm_range,
               options.number_of_bins,
+              options.calibration,
               options.reference,
               options.ppm,
               options.score_type,
               options.core,
               options.minimum,
-              tax_adjust,
-              reps,
-              all,
-              genes,
+              bundle.ncbi,
+              bundle.reps,
+              bundle.all,
+              bundle.genes,
               options.gene_number,
-              tax)
+              bundle.tax)
 
         now = time.ctime()
         cnvtime = time.strptime(now)
         print(time.strftime(
             "[%Y-%m-%d %H:%M:%S][batch_wf] Finished.", cnvtime))
 
+    def convert(self, options):
+        logger_init(self.logger, None, silent=options.silent)
+        self.logger.info(
+            '[convert] Convert pickled mass databases, metadata tables and annotation files into the columnar format.')
+
+        for db_file in DefaultValues.MASS_DBS:
+            if checkFileExistsNoBreak(db_file) == "1":
+                continue
+            path = convertMassDb(db_file, options.overwrite, options.mass_type)
+            if db_file in DefaultValues.INDEXED_DBS:
+                if options.overwrite or not os.path.isdir(os.path.join(path, INDEX_DIR)):
+                    buildMassIndex(path)
+                if options.overwrite or not os.path.isdir(os.path.join(path, BITSET_DIR)):
+                    buildBitsetIndex(path)
+
+        for db_file in DefaultValues.METADATA_DBS:
+            if checkFileExistsNoBreak(db_file) == "1":
+                continue
+            convertMetadata(db_file, options.overwrite)
+
+        if os.path.isdir(DefaultValues.GENOME_DIR):
+            convertAnnotations(DefaultValues.GENOME_DIR, options.overwrite)
+
+        self.stopwatch.lap()
+
+    def delta(self, options):
+        logger_init(self.logger, None, silent=options.silent)
+        self.logger.info(
+            '[delta] Append an update of the reference data as delta segments.')
+
+        checkDirExists(options.update_dir)
+        removed = []
+        if options.removed is not None:
+            checkFileExists(options.removed)
+            with open(options.removed) as f:
+                removed = [line.strip() for line in f if line.strip() != '']
+
+        applyUpdate(options.update_dir, removed)
+
+        self.stopwatch.lap()
+
+    def compact(self, options):
+        logger_init(self.logger, None, silent=options.silent)
+        self.logger.info(
+            '[compact] Merge the delta segments into the reference data.')
+
+        n = 0
+        for db_file in referenceTables():
+            if compactDb(db_file):
+                n += 1
+        if compactAnnotations(DefaultValues.GENOME_DIR):
+            n += 1
+        if n == 0:
+            self.logger.info('No delta segments found.')
+
+        self.stopwatch.lap()
+
+    def background(self, options):
+        logger_init(self.logger, None, silent=options.silent)
+        self.logger.info(
+            '[background] Precompute the background score table (' + options.reference + ').')
+
+        bundle = DatabaseBundle(options.reference, 'gtdb')
+        bundle.prefetch('reps', 'all', 'genes')
+
+        buildBackground(options.reference, bundle.reps, bundle.all, bundle.genes, options.seed)
+
+        self.stopwatch.lap()
+
+    def serve(self, options):
+        logger_init(self.logger, None, silent=options.silent)
+        self.logger.info(
+            '[serve] Identification server with resident databases.')
+
+        p = IdentifyServer(options.reference, options.taxonomy,
+                           options.seed, options.background)
+        self.stopwatch.lap()
+        p.run(options.host, options.port)
+
+    def client(self, options):
+        checkFileExists(options.input_file)
+        with open(options.input_file) as f:
+            request = {'name': os.path.basename(options.input_file),
+                       'peaks': f.read(),
+                       'ppm': options.ppm,
+                       'first': options.first,
+                       'top': options.top,
+                       'score_type': options.score_type,
+                       'minimum': options.minimum,
+                       'adjust': options.adjust,
+                       'auto_adjust': options.auto_adjust,
+                       'ppm_range': options.ppm_range,
+                       'number_of_bins': options.number_of_bins,
+                       'calibration': options.calibration,
+                       'engine': options.engine}
+        if options.out_dir is not None:
+            request['out_dir'] = os.path.abspath(options.out_dir)
+            request['filetype'] = options.filetype
+
+        result = requestServer(options.host, options.port, 'identify', request)
+
+        if options.json:
+            print(json.dumps(result, indent=1))
+            return
+        if 'error' in result:
+            print('  ERROR: ' + result['error'])
+            sys.exit(1)
+
+        print('#Search result here: with m/z adjustment of ' +
+              "{:.1f}".format(result['adjust']) + ' ppm')
+        print('#Genome Id\tprotein_hit\tribosomal_hit\tscore\tprobability\tlikelihood(%)\tncbi_name\tncbi_strain\ttaxonomy_' + result['taxonomy'])
+        for h in result['hits']:
+            print(h['genome_id'] + '\t' + str(h['protein_hit']) + '\t' + str(h['ribosomal_hit']) + '\t' + str(round(h['score'], 3)) + '\t' +
+                  "{:.2e}".format(h['probability']) + '\t' + h['likelihood'] + '\t' + h['ncbi_name'] + '\t' + h['ncbi_strain'] + '\t' + h['taxonomy'])
+        if 'plot' in result:
+            print('#Peak annotation: ' + str(result['plot']))
+
     def parse_options(self, options):
+        # only the inspection and the client run without the reference data
+        if options.subparser_name not in ('inspect', 'client'):
+            checkDataPath()
+
         if options.subparser_name == 'data':
             self.update_DB(options)
+        elif options.subparser_name == 'convert':
+            self.convert(options)
         elif options.subparser_name == 'adjust':
             self.adjust(options)
         elif options.subparser_name == 'inspect':
@@ -655,6 +626,16 @@ class OptionsParser():
             self.peak(options)
         elif options.subparser_name == 'debug':
             self.debug(options)
+        elif options.subparser_name == 'delta':
+            self.delta(options)
+        elif options.subparser_name == 'compact':
+            self.compact(options)
+        elif options.subparser_name == 'background':
+            self.background(options)
+        elif options.subparser_name == 'serve':
+            self.serve(options)
+        elif options.subparser_name == 'client':
+            self.client(options)
         else:
             self.logger.error('Unknown command: ' +
                               options.subparser_name + '\n')
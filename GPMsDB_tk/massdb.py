@@ -0,0 +1,496 @@
+#!/usr/bin/env python
+
+__author__ = 'Yuji Sekiguchi'
+__copyright__ = 'Copyright (c) 2023 Yuji Sekiguchi, National Institute of Advanced Industrial Science and Technology (AIST)'
+__credits__ = ['Yuji Sekiguchi']
+__license__ = 'GPL3.0'
+__maintainer__ = 'Yuji Sekiguchi'
+__email__ = 'y.sekiguchi@aist.go.jp'
+__status__ = 'Development'
+
+import os
+import sys
+import json
+import pickle
+import logging
+import tempfile
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+from GPMsDB_tk.defaultValues import DefaultValues
+
+MASS_FILE = 'masses.npy'
+OFFSET_FILE = 'offsets.npy'
+ID_FILE = 'ids.txt'
+SCALE_FILE = 'scale.npy'
+REMOVED_FILE = 'removed.txt'
+ENTRY_FILE = 'entries.db'
+SOURCE_FILE = 'source.json'
+
+
+class MassDB(Mapping):
+    """Columnar reference mass database.
+
+    The masses of all genomes are stored back to back in one float64 array
+    and offsets[i]:offsets[i + 1] delimits the masses of genome ids[i], so
+    the database behaves like the pickled {genome_id: [mass, ...]} dict.
+    Converted databases may hold the masses as float32, or as int32 in a
+    log-m/z scale of the given unit (scale); see massValues/massKeys.
+    """
+
+    def __init__(self, masses, offsets, ids, path=None, scale=None):
+        self.masses = masses
+        self.offsets = offsets
+        self.ids = ids
+        self.scale = scale
+        self.index = {g: i for i, g in enumerate(ids)}
+        self.path = path
+        self.binindex = None
+        self.bitset = None
+        self.columns = {}
+        self.aligned = {}
+        self.dead = np.empty(0, dtype=np.int64)
+
+    @classmethod
+    def fromDict(cls, db):
+        ids = [sys.intern(str(g)) for g in db.keys()]
+        lengths = np.fromiter((len(v) for v in db.values()),
+                              dtype=np.int64, count=len(ids))
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        masses = np.empty(offsets[-1], dtype=np.float64)
+        for i, v in enumerate(db.values()):
+            masses[offsets[i]:offsets[i + 1]] = v
+
+        return cls(masses, offsets, ids)
+
+    def __getitem__(self, genome_id):
+        i = self.index[genome_id]
+        return massValues(self.masses[self.offsets[i]:self.offsets[i + 1]], self.scale)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, genome_id):
+        return genome_id in self.index
+
+    def __reduce__(self):
+        # memory-mapped databases are reopened by path in worker processes
+        # so that the pages stay shared instead of being pickled
+        if self.path is not None:
+            return (openMassDb, (self.path,))
+        return (MassDB, (np.asarray(self.masses), np.asarray(self.offsets), self.ids,
+                         None, self.scale))
+
+    @property
+    def segments(self):
+        # (first position, database) of the parts of the genome index
+        return [(0, self)]
+
+    def positions(self, ids):
+        # dense integer ids of the given genomes, -1 where absent
+        return np.fromiter((self.index.get(g, -1) for g in ids),
+                           dtype=np.int64, count=len(ids))
+
+    def column(self, name, values):
+        # per-genome values (e.g. gene counts) as a float64 vector aligned to
+        # ids, NaN where missing; built once per database
+        if name not in self.columns:
+            self.columns[name] = np.fromiter(
+                (values.get(g, np.nan) for g in self.ids),
+                dtype=np.float64, count=len(self.ids))
+        return self.columns[name]
+
+    def align(self, other):
+        # positions in this database of the genomes of other (a vector
+        # aligned to other.ids, -1 where absent); built once per pair
+        key = id(other.ids)
+        if key not in self.aligned:
+            self.aligned[key] = (other.ids, self.positions(other.ids))
+        return self.aligned[key][1]
+
+    def update(self, other):
+        merged = dict(self.items())
+        merged.update(other)
+        db = MassDB.fromDict(merged)
+
+        self.masses = db.masses
+        self.offsets = db.offsets
+        self.ids = db.ids
+        self.index = db.index
+        self.scale = None
+        self.path = None
+        self.binindex = None
+        self.bitset = None
+        self.columns = {}
+        self.aligned = {}
+
+
+class MassOverlay(MassDB):
+    """A custom database laid over a base database without copying it.
+
+    The genome index is that of base followed by that of custom, so the
+    positions of the base genomes do not change and the searches run over
+    each segment (see segments). Base genomes that reappear in custom are
+    shadowed: their positions stay in the index as dead positions that
+    never hit and have no gene count. The base genomes in removed (the
+    tombstones of a delta segment) are hidden in the same way.
+    """
+
+    def __init__(self, base, custom, removed=()):
+        self.base = base
+        self.custom = custom
+        self.removed = frozenset(g for g in removed if g not in custom.index)
+        self.ids = OverlayIds(base.ids, custom.ids)
+        self.scale = None
+
+        hidden = base.positions(list(custom.ids) + list(self.removed))
+        hidden = np.unique(hidden[hidden >= 0])
+        self.dead = np.concatenate((base.dead, hidden, custom.dead + len(base)))
+        self.index = OverlayIndex(base.index, custom.index, len(base), len(hidden),
+                                  self.removed)
+
+        self.path = None
+        self.binindex = None
+        self.bitset = None
+        self.columns = {}
+        self.aligned = {}
+
+    def __getitem__(self, genome_id):
+        if genome_id in self.custom:
+            return self.custom[genome_id]
+        if genome_id in self.removed:
+            raise KeyError(genome_id)
+        return self.base[genome_id]
+
+    def __iter__(self):
+        for g in self.base:
+            if g not in self.custom and g not in self.removed:
+                yield g
+        yield from self.custom
+
+    def __reduce__(self):
+        return (MassOverlay, (self.base, self.custom, self.removed))
+
+    @property
+    def segments(self):
+        # empty segments (e.g. deltas that only remove genomes) are skipped
+        n = len(self.base)
+        return self.base.segments + [(n + start, db) for start, db in self.custom.segments
+                                     if len(db) > 0]
+
+    def column(self, name, values):
+        if name not in self.columns:
+            MassDB.column(self, name, values)[self.dead] = np.nan
+        return self.columns[name]
+
+
+class OverlayIds(Sequence):
+    """Genome ids of a base and a custom segment as one sequence."""
+
+    def __init__(self, base, custom):
+        self.base = base
+        self.custom = custom
+
+    def __len__(self):
+        return len(self.base) + len(self.custom)
+
+    def __getitem__(self, i):
+        n = len(self.base)
+        if i < 0:
+            i += len(self)
+        if i < n:
+            return self.base[i]
+        return self.custom[i - n]
+
+    def __iter__(self):
+        yield from self.base
+        yield from self.custom
+
+
+class OverlayIndex(Mapping):
+    """Positions of the live genomes of an overlay (custom entries first)."""
+
+    def __init__(self, base, custom, n_base, n_hidden, removed=frozenset()):
+        self.base = base
+        self.custom = custom
+        self.n_base = n_base
+        self.n_hidden = n_hidden
+        self.removed = removed
+
+    def __getitem__(self, genome_id):
+        if genome_id in self.custom:
+            return self.n_base + self.custom[genome_id]
+        if genome_id in self.removed:
+            raise KeyError(genome_id)
+        return self.base[genome_id]
+
+    def __iter__(self):
+        for g in self.base:
+            if g not in self.custom and g not in self.removed:
+                yield g
+        yield from self.custom
+
+    def __len__(self):
+        return len(self.base) + len(self.custom) - self.n_hidden
+
+    def __contains__(self, genome_id):
+        return genome_id in self.custom or (genome_id not in self.removed and
+                                            genome_id in self.base)
+
+
+class TableOverlay(Mapping):
+    """The entries of a delta segment laid over a (non-mass) table."""
+
+    def __init__(self, base, entries, removed=()):
+        self.base = base
+        self.entries = entries
+        self.removed = frozenset(g for g in removed if g not in entries)
+
+    def __getitem__(self, key):
+        if key in self.entries:
+            return self.entries[key]
+        if key in self.removed:
+            raise KeyError(key)
+        return self.base[key]
+
+    def __iter__(self):
+        for k in self.base:
+            if k not in self.entries and k not in self.removed:
+                yield k
+        yield from self.entries
+
+    def __len__(self):
+        return sum(1 for k in self)
+
+    def __contains__(self, key):
+        return key in self.entries or (key not in self.removed and key in self.base)
+
+
+def massValues(masses, scale):
+    # stored masses as float64 m/z
+    if scale is None:
+        return np.asarray(masses, dtype=np.float64)
+    return np.exp(np.asarray(masses, dtype=np.float64) * scale)
+
+
+def massKeys(mz, scale):
+    # m/z bounds in the scale of the stored masses; in the log scale a ppm
+    # window is a range of (nearly) constant width
+    if scale is None:
+        return mz
+    return np.log(mz) / scale
+
+
+def encodeMasses(mz, mass_type):
+    # float64/float32 m/z, or int32 in units of MASS_UNIT ppm of log-m/z
+    if mass_type == 'int32':
+        scale = logScale()
+        return np.rint(np.log(np.maximum(mz, 1.0)) / scale).astype(np.int32)
+    return np.asarray(mz, dtype=mass_type)
+
+
+def logScale():
+    return float(np.log1p(DefaultValues.MASS_UNIT / 1000000))
+
+
+def columnarPath(db_file):
+    return os.path.splitext(db_file)[0] + '.cdb'
+
+
+def deltaPath(db_file):
+    return os.path.splitext(db_file)[0] + '.delta'
+
+
+def deltaSegments(db_file):
+    # delta segments of a table, oldest first (unfinished ones end in .tmp)
+    path = deltaPath(db_file)
+    if not os.path.isdir(path):
+        return []
+
+    return [os.path.join(path, d) for d in sorted(os.listdir(path))
+            if not d.endswith('.tmp')]
+
+
+def openMassDb(path):
+    masses = np.load(os.path.join(path, MASS_FILE), mmap_mode='r')
+    offsets = np.load(os.path.join(path, OFFSET_FILE), mmap_mode='r')
+    ids = readIds(path)
+    scale = None
+    if os.path.isfile(os.path.join(path, SCALE_FILE)):
+        scale = float(np.load(os.path.join(path, SCALE_FILE)))
+
+    return MassDB(masses, offsets, ids, path, scale)
+
+
+def readIds(path, name=ID_FILE):
+    with open(os.path.join(path, name)) as f:
+        return [sys.intern(line.rstrip('\n')) for line in f]
+
+
+def writeSource(db_file, path):
+    # size and modification time of the pickled table a columnar one is
+    # converted from
+    if not os.path.isfile(db_file):
+        return
+
+    stat = os.stat(db_file)
+    with open(os.path.join(path, SOURCE_FILE), 'w') as f:
+        json.dump({'size': stat.st_size, 'mtime': stat.st_mtime_ns}, f)
+
+
+def sourceChanged(db_file, path):
+    # True when the pickled table was replaced after the conversion (tables
+    # converted without a record, or whose pickle was removed, are trusted)
+    if not os.path.isfile(os.path.join(path, SOURCE_FILE)) or not os.path.isfile(db_file):
+        return False
+
+    with open(os.path.join(path, SOURCE_FILE)) as f:
+        source = json.load(f)
+    stat = os.stat(db_file)
+
+    return source['size'] != stat.st_size or source['mtime'] != stat.st_mtime_ns
+
+
+def loadBaseDb(db_file):
+    from GPMsDB_tk.metadata import openMetadata, KEY_FILE
+
+    path = columnarPath(db_file)
+    if os.path.isdir(path) and sourceChanged(db_file, path):
+        logger = logging.getLogger('GPMsDB_tk')
+        logger.warning(db_file + ' was modified after its conversion to ' + path +
+                       ', the pickled table is read instead (run "GPMsDB_tk convert --overwrite").')
+    elif os.path.isfile(os.path.join(path, KEY_FILE)):
+        return openMetadata(path)
+    elif os.path.isdir(path):
+        return openMassDb(path)
+
+    with open(db_file, 'rb') as f:
+        return pickle.load(f)
+
+
+def applyDeltas(db_file, db):
+    # delta segments (added or replaced genomes and the removed ones) are
+    # laid over the table in order, so an update loads only its own genomes
+    for path in deltaSegments(db_file):
+        removed = []
+        if os.path.isfile(os.path.join(path, REMOVED_FILE)):
+            removed = readIds(path, REMOVED_FILE)
+        if os.path.isfile(os.path.join(path, MASS_FILE)):
+            if not isinstance(db, MassDB):
+                db = MassDB.fromDict(db)
+            db = MassOverlay(db, openMassDb(path), removed)
+        else:
+            entries = {}
+            if os.path.isfile(os.path.join(path, ENTRY_FILE)):
+                with open(os.path.join(path, ENTRY_FILE), 'rb') as f:
+                    entries = pickle.load(f)
+            db = TableOverlay(db, entries, removed)
+
+    return db
+
+
+def loadDb(db_file):
+    return applyDeltas(db_file, loadBaseDb(db_file))
+
+
+def loadMassDb(db_file):
+    db = loadBaseDb(db_file)
+    if not isinstance(db, MassDB):
+        db = MassDB.fromDict(db)
+
+    return applyDeltas(db_file, db)
+
+
+def writeIds(ids, path, name=ID_FILE):
+    with open(os.path.join(path, name), 'w') as f:
+        for g in ids:
+            f.write(str(g) + '\n')
+
+
+def writeMassDb(db, path):
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, MASS_FILE), np.asarray(db.masses))
+    np.save(os.path.join(path, OFFSET_FILE), np.asarray(db.offsets))
+    if db.scale is not None:
+        np.save(os.path.join(path, SCALE_FILE), db.scale)
+    writeIds(db.ids, path)
+
+
+def shareMassDb(db, tmp_dir, index=False, bitset=False):
+    # worker processes attach to memory-mapped files by path, so databases
+    # held in process memory are first written to tmp_dir (with the m/z
+    # index and the bitset index when the workers search them)
+    from GPMsDB_tk.massindex import getMassIndex, INDEX_DIR
+    from GPMsDB_tk.bitset import getBitsetIndex, BITSET_DIR
+
+    # overlays are shared segment by segment, so only the segments held in
+    # process memory (usually the small custom one) are written out
+    if isinstance(db, MassOverlay):
+        return MassOverlay(shareMassDb(db.base, tmp_dir, index, bitset),
+                           shareMassDb(db.custom, tmp_dir, index, bitset), db.removed)
+
+    if db.path is not None:
+        if ((not index or os.path.isdir(os.path.join(db.path, INDEX_DIR))) and
+                (not bitset or os.path.isdir(os.path.join(db.path, BITSET_DIR)))):
+            return db
+
+    path = tempfile.mkdtemp(suffix='.cdb', dir=tmp_dir)
+    writeMassDb(db, path)
+    if index:
+        getMassIndex(db).save(os.path.join(path, INDEX_DIR))
+    if bitset:
+        getBitsetIndex(db).save(os.path.join(path, BITSET_DIR))
+
+    return openMassDb(path)
+
+
+def writeColumnar(db, path, mass_type='float64'):
+    # the live genomes of a mass table (a dict or a database, overlays
+    # included) in order, with the masses stored as mass_type
+    os.makedirs(path, exist_ok=True)
+    ids = list(db.keys())
+    offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+    for i, g in enumerate(ids):
+        offsets[i + 1] = offsets[i] + len(db[g])
+
+    masses = np.lib.format.open_memmap(os.path.join(path, MASS_FILE), mode='w+',
+                                       dtype=mass_type, shape=(int(offsets[-1]),))
+    for i, g in enumerate(ids):
+        masses[offsets[i]:offsets[i + 1]] = encodeMasses(db[g], mass_type)
+    masses.flush()
+    del masses
+
+    np.save(os.path.join(path, OFFSET_FILE), offsets)
+    if mass_type == 'int32':
+        np.save(os.path.join(path, SCALE_FILE), logScale())
+    elif os.path.isfile(os.path.join(path, SCALE_FILE)):
+        os.remove(os.path.join(path, SCALE_FILE))
+    writeIds(ids, path)
+
+    return len(ids), int(offsets[-1])
+
+
+def convertMassDb(db_file, overwrite=False, mass_type='float64'):
+    logger = logging.getLogger('GPMsDB_tk')
+
+    path = columnarPath(db_file)
+    if os.path.isdir(path) and not overwrite:
+        logger.info('Columnar database already exists: ' + path)
+        return path
+
+    with open(db_file, 'rb') as f:
+        db = pickle.load(f)
+
+    n_genomes, n_masses = writeColumnar(db, path, mass_type)
+    writeSource(db_file, path)
+
+    logger.info('Converted ' + db_file + ' (' + str(n_genomes) + ' genomes, ' +
+                str(n_masses) + ' ' + mass_type + ' masses) to ' + path)
+
+    return path
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+__author__ = 'Yuji Sekiguchi'
+__copyright__ = 'Copyright (c) 2023 Yuji Sekiguchi, National Institute of Advanced Industrial Science and Technology (AIST)'
+__credits__ = ['Yuji Sekiguchi']
+__license__ = 'GPL3.0'
+__maintainer__ = 'Yuji Sekiguchi'
+__email__ = 'y.sekiguchi@aist.go.jp'
+__status__ = 'Development'
+
+import os
+import json
+import logging
+
+import numpy as np
+
+from GPMsDB_tk.defaultValues import DefaultValues
+from GPMsDB_tk.massdb import openMassDb, massValues
+
+INDEX_DIR = 'index'
+
+
+class MassIndex(object):
+    """Inverted index from log-m/z bins to posting lists of reference masses.
+
+    Bins are log(1 + bin_ppm / 1e6) wide, so the tolerance window of a
+    query peak only overlaps a few of them. Postings are sorted by mass and
+    bin_offsets[b - first_bin]:bin_offsets[b - first_bin + 1] holds bin b.
+    """
+
+    def __init__(self, bin_ppm, first_bin, bin_offsets, post_index, post_genome, post_mass):
+        self.bin_ppm = bin_ppm
+        self.width = np.log1p(bin_ppm / 1000000)
+        self.first_bin = first_bin
+        self.bin_offsets = bin_offsets
+        self.post_index = post_index
+        self.post_genome = post_genome
+        self.post_mass = post_mass
+
+    @classmethod
+    def build(cls, masses, offsets, bin_ppm=DefaultValues.INDEX_PPM):
+        masses = np.asarray(masses, dtype=np.float64)
+        order = np.argsort(masses, kind='stable')
+        post_mass = masses[order]
+        post_genome = (np.searchsorted(offsets, order, side='right') - 1).astype(np.int32)
+
+        width = np.log1p(bin_ppm / 1000000)
+        bins = massBins(post_mass, width)
+        first_bin = int(bins[0]) if len(bins) else 0
+        last_bin = int(bins[-1]) if len(bins) else 0
+        bin_offsets = np.searchsorted(
+            bins, np.arange(first_bin, last_bin + 2), side='left')
+
+        return cls(bin_ppm, first_bin, bin_offsets, order, post_genome, post_mass)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'bin_offsets.npy'), self.bin_offsets)
+        np.save(os.path.join(path, 'post_index.npy'), self.post_index)
+        np.save(os.path.join(path, 'post_genome.npy'), self.post_genome)
+        np.save(os.path.join(path, 'post_mass.npy'), self.post_mass)
+        with open(os.path.join(path, 'index.json'), 'w') as f:
+            json.dump({'bin_ppm': self.bin_ppm, 'first_bin': self.first_bin}, f)
+
+    @classmethod
+    def open(cls, path):
+        with open(os.path.join(path, 'index.json')) as f:
+            meta = json.load(f)
+
+        return cls(meta['bin_ppm'], meta['first_bin'],
+                   np.load(os.path.join(path, 'bin_offsets.npy'), mmap_mode='r'),
+                   np.load(os.path.join(path, 'post_index.npy'), mmap_mode='r'),
+                   np.load(os.path.join(path, 'post_genome.npy'), mmap_mode='r'),
+                   np.load(os.path.join(path, 'post_mass.npy'), mmap_mode='r'))
+
+    def postings(self, lower, upper):
+        # posting ranges of the bins overlapping each window (one bin of
+        # margin on both sides keeps edge rounding of log() harmless)
+        n_bins = len(self.bin_offsets) - 1
+        bl = np.clip(massBins(lower, self.width) - self.first_bin - 1, 0, n_bins)
+        bu = np.clip(massBins(upper, self.width) - self.first_bin + 2, 0, n_bins)
+        a = np.asarray(self.bin_offsets[bl])
+        b = np.asarray(self.bin_offsets[bu])
+
+        cnt = np.maximum(b - a, 0)
+        qs = np.repeat(np.arange(len(lower)), cnt)
+        ps = np.arange(len(qs)) - np.repeat(np.cumsum(cnt) - cnt, cnt) + np.repeat(a, cnt)
+
+        m = np.asarray(self.post_mass[ps])
+        ok = (lower[qs] < m) & (m < upper[qs])
+        ps = ps[ok]
+
+        return (np.asarray(self.post_index[ps], dtype=np.int64), qs[ok],
+                np.asarray(self.post_genome[ps], dtype=np.int64))
+
+
+def massBins(masses, width):
+    return np.floor(np.log(np.maximum(masses, 1.0)) / width).astype(np.int64)
+
+
+def getMassIndex(db):
+    if db.binindex is not None:
+        return db.binindex
+
+    if db.path is not None and os.path.isdir(os.path.join(db.path, INDEX_DIR)):
+        db.binindex = MassIndex.open(os.path.join(db.path, INDEX_DIR))
+    else:
+        logger = logging.getLogger('GPMsDB_tk')
+        logger.info('Building m/z bin index (' + str(len(db)) + ' genomes).')
+        db.binindex = MassIndex.build(massValues(db.masses, db.scale), db.offsets)
+
+    return db.binindex
+
+
+def buildMassIndex(path):
+    db = openMassDb(path)
+    index = MassIndex.build(massValues(db.masses, db.scale), db.offsets)
+    index.save(os.path.join(path, INDEX_DIR))
+
+    logger = logging.getLogger('GPMsDB_tk')
+    logger.info('m/z bin index (' + str(len(index.bin_offsets) - 1) +
+                ' bins) saved to ' + os.path.join(path, INDEX_DIR))
+
+    return index
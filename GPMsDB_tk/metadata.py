@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+__author__ = 'Yuji Sekiguchi'
+__copyright__ = 'Copyright (c) 2023 Yuji Sekiguchi, National Institute of Advanced Industrial Science and Technology (AIST)'
+__credits__ = ['Yuji Sekiguchi']
+__license__ = 'GPL3.0'
+__maintainer__ = 'Yuji Sekiguchi'
+__email__ = 'y.sekiguchi@aist.go.jp'
+__status__ = 'Development'
+
+import os
+import pickle
+import logging
+from collections import OrderedDict
+from collections.abc import Mapping
+
+import numpy as np
+
+from GPMsDB_tk.defaultValues import DefaultValues
+from GPMsDB_tk.massdb import columnarPath, writeSource
+
+KEY_FILE = 'keys.npy'
+VALUE_FILE = 'values.bin'
+VALUE_OFFSET_FILE = 'value_offsets.npy'
+
+
+class MetadataTable(Mapping):
+    """Names, strains and taxonomy strings of the genomes on disk.
+
+    keys.npy holds the genome ids as a sorted fixed-width byte string array
+    searched in place, values.bin the matching UTF-8 strings back to back
+    (delimited by value_offsets). Both are memory-mapped, so opening a table
+    reads nothing and only the looked up strings are decoded; the most
+    recently used ones are kept.
+    """
+
+    def __init__(self, path, size=DefaultValues.METADATA_CACHE):
+        self.path = path
+        self.keys = np.load(os.path.join(path, KEY_FILE), mmap_mode='r')
+        self.offsets = np.load(os.path.join(path, VALUE_OFFSET_FILE), mmap_mode='r')
+        self.size = size
+        self.cache = OrderedDict()
+
+        # np.memmap refuses empty files
+        self.values = b''
+        if self.offsets[-1] > 0:
+            self.values = np.memmap(os.path.join(path, VALUE_FILE), dtype=np.uint8, mode='r')
+
+    def find(self, key):
+        # position of key, -1 where absent
+        if not isinstance(key, str) or len(self.keys) == 0:
+            return -1
+        k = key.encode('utf-8')
+        if len(k) > self.keys.dtype.itemsize:
+            return -1
+
+        i = int(np.searchsorted(self.keys, np.bytes_(k)))
+        if i < len(self.keys) and self.keys[i] == k:
+            return i
+        return -1
+
+    def __getitem__(self, key):
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        i = self.find(key)
+        if i < 0:
+            raise KeyError(key)
+        value = bytes(self.values[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+
+        self.cache[key] = value
+        if len(self.cache) > self.size:
+            self.cache.popitem(last=False)
+
+        return value
+
+    def __contains__(self, key):
+        return key in self.cache or self.find(key) >= 0
+
+    def __iter__(self):
+        for k in self.keys:
+            yield k.decode('utf-8')
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __reduce__(self):
+        # reopened by path in worker processes
+        return (openMetadata, (self.path,))
+
+
+def openMetadata(path):
+    return MetadataTable(path)
+
+
+def writeMetadata(table, path):
+    os.makedirs(path, exist_ok=True)
+
+    keys = np.array(sorted(k.encode('utf-8') for k in table), dtype=np.bytes_)
+    values = [table[k.decode('utf-8')].encode('utf-8') for k in keys]
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum([len(v) for v in values], out=offsets[1:])
+
+    np.save(os.path.join(path, KEY_FILE), keys)
+    np.save(os.path.join(path, VALUE_OFFSET_FILE), offsets)
+    with open(os.path.join(path, VALUE_FILE), 'wb') as f:
+        for v in values:
+            f.write(v)
+
+    return len(keys)
+
+
+def convertMetadata(db_file, overwrite=False):
+    # pickled {genome_id: string} tables
+    logger = logging.getLogger('GPMsDB_tk')
+
+    path = columnarPath(db_file)
+    if os.path.isdir(path) and not overwrite:
+        logger.info('Metadata table already exists: ' + path)
+        return path
+
+    with open(db_file, 'rb') as f:
+        table = pickle.load(f)
+
+    n = writeMetadata(table, path)
+    writeSource(db_file, path)
+    logger.info('Converted ' + db_file + ' (' + str(n) + ' genomes) to ' + path)
+
+    return path
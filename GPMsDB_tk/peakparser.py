@@ -12,10 +12,11 @@ import os
 import sys
 import logging
 
-import matplotlib.pyplot as plt
-plt.rcParams.update({'figure.max_open_warning': 0})
+import numpy as np
 
-from GPMsDB_tk.common import PeakLoader
+from GPMsDB_tk.common import readPeakList
+from GPMsDB_tk.annotation import getAnnotation
+from GPMsDB_tk.renderer import renderLocal
 from GPMsDB_tk.common import makeSurePathExists, checkFileExists
 
 
@@ -25,15 +26,17 @@ class PeakParser(object):
         self.figdpi = 200
         self.logger = logging.getLogger('GPMsDB_tk')
 
-    def run(self, input_file, reference, out_dir, ppm, genome_ref, adjust, filetype, db):
+    def run(self, input_file, reference, out_dir, ppm, genome_ref, adjust, filetype, db, peaklist=None, renderer=None):
         if filetype.lower() == "pdf":
             figdpi = 72
         else:
             figdpi = self.figdpi
 
-        file_name = str(genome_ref + '_annotation.tsv')
-        reference_file = os.path.join(db, file_name)
-        if not os.path.exists(reference_file):
+        # annotation tables are read from the archive or the per-genome
+        # file once and kept in a per-process cache
+        table = getAnnotation(genome_ref, db)
+        if table is None:
+            file_name = str(genome_ref + '_annotation.tsv')
             self.logger.error('Annotation file not exist for ' + file_name)
             return
 
@@ -46,7 +49,10 @@ class PeakParser(object):
         if not os.path.exists(out_dir):
             os.mkdir(out_dir)
 
-        intens, t, tp, com = PeakLoader(input_file, 0)
+        # workflows hand over the peak list they have already parsed
+        if peaklist is None:
+            peaklist = readPeakList(input_file)
+        intens, t, tp, com = peaklist.load(0)
         if len(list(intens)) == 0:
             self.logger.error('Peaks not found.')
             sys.exit(1)
@@ -54,29 +60,16 @@ class PeakParser(object):
         if com == "":
             com = "not specified"
 
-        data = {}
-        for line in open(reference_file):
-            lineSplit = line.split('\t')
-            if lineSplit[0] == '#' or lineSplit[0] == '':
-                continue
+        masses, labels = table
 
-            else:
-                peak = lineSplit[0].rstrip()
-                data[peak] = str(lineSplit[1].rstrip() + "\t" + peak)
+        # all reference proteins within the tolerance window of each peak
+        peaks = list(intens.keys())
+        lo, hi = annotationWindows(np.array(peaks, dtype=np.float64), masses, ppm, adjust)
 
         fd = {}
-        for i in intens.keys():
-            upper_peak = float(i) + (float(i) * ppm / 1000000) + \
-                (float(i) * adjust / 1000000)
-            lower_peak = float(i) - (float(i) * ppm / 1000000) + \
-                (float(i) * adjust / 1000000)
-            for k in data.keys():
-                if lower_peak < float(k) < upper_peak:
-                    try:
-                        fd[i].append(data[k])
-                    except:
-                        fd[i] = []
-                        fd[i] = data[k]
+        for i, l, h in zip(peaks, lo, hi):
+            if h > l:
+                fd[i] = labels[l:h]
 
         ri = {}
         ri2 = {}
@@ -87,96 +80,38 @@ class PeakParser(object):
 
         self.logger.info("peak m/z\tintensity\tgene annotation\tmw")
         for i in fd:
-            self.logger.info(
-                str(i) + "\t" + "{:.3f}".format(ri[i]) + "\t" + fd[i])
-
-        # generating graphs
-        x = list(ri.keys())
-        y = list(ri.values())
-
-        x1 = list(ri2.keys())
-        y2 = list(ri2.values())
-
-        title = str("Peak annotation for " + str(basename) + "\n" +
-                    "Total number of peaks: " + str(len(intens)) + "\n" +
-                    "Reference genome: " + str(genome_ref))
-
-        fig, ax = plt.subplots()
-        plt.figure(figsize=(15, 10)).patch.set_facecolor('white')
-        #plt.suptitle(title, fontsize = 13, x=fig.subplotpars.left, ha = 'left')
-        plt.rcParams["font.size"] = 12
-        #plt.rcParams['font.family'] = 'sans-serif'
-        #plt.rcParams['font.sans-serif'] = ['Arial']
-
-        ax1 = plt.subplot(2, 1, 1)
-
-        if not len(intens) == 0:
-            ax1.stem(x, y, linefmt="k-", basefmt=" ",
-                     markerfmt=" ", use_line_collection=True)
-        if not len(ri2) == 0:
-            ax1.stem(x1, y2, linefmt="C3-", basefmt=" ",
-                     markerfmt=" ", use_line_collection=True)
-
-        plt.grid(True, axis="y", color='black', linestyle=':', linewidth=0.5)
-        ax1.xaxis.set_major_formatter(plt.FuncFormatter(
-            lambda x, loc: "{:,}".format(int(x))))
-        plt.ylim(0,)
-        plt.xlim(0, 15000)
-        plt.gca().spines['right'].set_visible(False)
-        plt.gca().spines['top'].set_visible(False)
-        plt.xlabel("m/z", fontsize=14)
-        plt.ylabel("relative intensity (linear, %)", fontsize=14)
-
-        ax2 = plt.subplot(2, 1, 2)
-
-        plt.yscale('log')
-
-        if not len(intens) == 0:
-            ax2.stem(x, y, linefmt="k-", basefmt=" ",
-                     markerfmt=" ", use_line_collection=True)
-        if not len(ri2) == 0:
-            ax2.stem(x1, y2, linefmt="C3-", basefmt=" ",
-                     markerfmt=" ", use_line_collection=True)
-
-        plt.grid(True, axis="y", color='black', linestyle=':', linewidth=0.5)
-        ax2.xaxis.set_major_formatter(plt.FuncFormatter(
-            lambda x, loc: "{:,}".format(int(x))))
-        plt.xlim(0, 15000)
-        plt.xlabel("m/z", fontsize=14)
-        plt.ylabel("relative intensity (log, %)", fontsize=14)
-
-        result = sorted(fd.items(), key=lambda x: x[0], reverse=True)
-        dic = dict(result)
-        y_axis_min, y_axis_max = ax1.get_ylim()
-
-        if len(fd) > 0:
-            a = 0
-            for k in dic:
-                bar = (y_axis_max - ri[k]) / y_axis_max * figdpi * 3
-                line = fd[k].split("\t")
-                try:
-                    if line[0] == "":
-                        line[0] = "hypothetical protein"
-                except:
+            for annotation in fd[i]:
+                self.logger.info(
+                    str(i) + "\t" + "{:.3f}".format(ri[i]) + "\t" + annotation)
+
+        # the plot is drawn from a plain record, here or by a renderer process
+        annotations = []
+        for k in sorted(fd, reverse=True):
+            genes = []
+            for annotation in fd[k]:
+                line = annotation.split("\t")
+                if line[0] == "":
                     line[0] = "hypothetical protein"
-                gene = str(str(
-                    k) + " m/z, " + line[0] + " (" + "{:.3f}".format(float(line[1])) + " theoretical m/z)")
-                ax1.annotate(str(gene),
-                             xy=(k, ri[k]),
-                             xycoords='data', rotation=90,
-                             xytext=(890 - a, 610),
-                             textcoords='figure points', size=9,
-                             arrowprops=dict(arrowstyle="-",
-                                             relpos=(0.5, 0),
-                                             connectionstyle="arc, angleA=-90, armA=" + "10" +
-                                             ",angleB= 90, armB=" + str(bar) +
-                                             ",rad=0", linewidth=0.5, color='#808080'),
-
-                             horizontalalignment='center', verticalalignment='bottom')
-                a += 10
-
-        plt.savefig(outfile, dpi=figdpi, format=filetype,
-                    bbox_inches='tight', pad_inches=0.1)
-        plt.close()
-
-        return
+                genes.append(line[0] + " (" + "{:.3f}".format(float(line[1])) + " theoretical m/z)")
+            annotations.append((k, ri[k], str(str(k) + " m/z, " + " / ".join(genes))))
+
+        record = {'outfile': outfile, 'filetype': filetype, 'figdpi': figdpi,
+                  'x': list(ri.keys()), 'y': list(ri.values()),
+                  'x1': list(ri2.keys()), 'y2': list(ri2.values()),
+                  'annotations': annotations}
+        if renderer is None:
+            renderLocal(record)
+        else:
+            renderer.put(record)
+
+        return outfile
+
+
+def annotationWindows(peaks, masses, ppm, adjust):
+    # [lo, hi) ranges of masses strictly inside the (shifted) ppm window of
+    # each peak, by binary search
+    upper = peaks + (peaks * ppm / 1000000) + (peaks * adjust / 1000000)
+    lower = peaks - (peaks * ppm / 1000000) + (peaks * adjust / 1000000)
+
+    return (np.searchsorted(masses, lower, side='right'),
+            np.searchsorted(masses, upper, side='left'))
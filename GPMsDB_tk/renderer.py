@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+
+__author__ = 'Yuji Sekiguchi'
+__copyright__ = 'Copyright (c) 2023 Yuji Sekiguchi, National Institute of Advanced Industrial Science and Technology (AIST)'
+__credits__ = ['Yuji Sekiguchi']
+__license__ = 'GPL3.0'
+__maintainer__ = 'Yuji Sekiguchi'
+__email__ = 'y.sekiguchi@aist.go.jp'
+__status__ = 'Development'
+
+import logging
+import multiprocessing as mp
+
+import numpy as np
+
+# matplotlib is imported by the renderers only, so that the commands and
+# worker processes that draw no figures do not pay for loading it
+
+
+class Renderer(object):
+    """One Agg figure per process, cleared and reused for every plot."""
+
+    def __init__(self):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        self.figure = Figure(figsize=(15, 10))
+        self.figure.patch.set_facecolor('white')
+        FigureCanvasAgg(self.figure)
+
+    def render(self, record):
+        import matplotlib
+
+        self.figure.clf()
+        if record.get('kind') == 'inspect':
+            rc = {'font.size': 12, 'font.family': 'sans-serif', 'font.sans-serif': ['Arial']}
+            draw = drawInspect
+        else:
+            rc = {'font.size': 12}
+            draw = drawAnnotation
+        with matplotlib.rc_context(rc):
+            draw(self.figure, record)
+            self.figure.savefig(record['outfile'], dpi=record['figdpi'], format=record['filetype'],
+                                bbox_inches='tight', pad_inches=0.1)
+
+        return record['outfile']
+
+
+def drawStems(ax, classes):
+    # one vlines collection per class instead of an artist per peak; the
+    # arrays are shared by the linear and the log panels. The peak tops are
+    # added to the data limits (as the markers of ax.stem did) so that the
+    # log scale extends down to the weakest peak
+    for x, y, color in classes:
+        if not len(x) == 0:
+            ax.vlines(x, 0, y, colors=color, linestyles='solid')
+            ax.update_datalim(np.column_stack([x, y]))
+
+
+def drawAnnotation(fig, record):
+    # two panels (linear/log) of all peaks in black and the annotated peaks
+    # in red, with the protein names of the annotated peaks on top
+    from matplotlib.ticker import FuncFormatter
+
+    classes = [(np.asarray(record['x']), np.asarray(record['y']), 'k'),
+               (np.asarray(record['x1']), np.asarray(record['y2']), 'C3')]
+    figdpi = record['figdpi']
+
+    ax1 = fig.add_subplot(2, 1, 1)
+    drawStems(ax1, classes)
+
+    ax1.grid(True, axis="y", color='black', linestyle=':', linewidth=0.5)
+    ax1.xaxis.set_major_formatter(FuncFormatter(
+        lambda x, loc: "{:,}".format(int(x))))
+    ax1.set_ylim(0,)
+    ax1.set_xlim(0, 15000)
+    ax1.spines['right'].set_visible(False)
+    ax1.spines['top'].set_visible(False)
+    ax1.set_xlabel("m/z", fontsize=14)
+    ax1.set_ylabel("relative intensity (linear, %)", fontsize=14)
+
+    ax2 = fig.add_subplot(2, 1, 2)
+
+    ax2.set_yscale('log')
+    drawStems(ax2, classes)
+
+    ax2.grid(True, axis="y", color='black', linestyle=':', linewidth=0.5)
+    ax2.xaxis.set_major_formatter(FuncFormatter(
+        lambda x, loc: "{:,}".format(int(x))))
+    ax2.set_xlim(0, 15000)
+    ax2.set_xlabel("m/z", fontsize=14)
+    ax2.set_ylabel("relative intensity (log, %)", fontsize=14)
+
+    y_axis_min, y_axis_max = ax1.get_ylim()
+
+    a = 0
+    for k, intensity, gene in record['annotations']:
+        bar = (y_axis_max - intensity) / y_axis_max * figdpi * 3
+        ax1.annotate(str(gene),
+                     xy=(k, intensity),
+                     xycoords='data', rotation=90,
+                     xytext=(890 - a, 610),
+                     textcoords='figure points', size=9,
+                     arrowprops=dict(arrowstyle="-",
+                                     relpos=(0.5, 0),
+                                     connectionstyle="arc, angleA=-90, armA=" + "10" +
+                                     ",angleB= 90, armB=" + str(bar) +
+                                     ",rad=0", linewidth=0.5, color='#808080'),
+
+                     horizontalalignment='center', verticalalignment='bottom')
+        a += 10
+
+
+# intensity classes of the inspection plot: lower bound, color, label
+INSPECT_CLASSES = [(0.01, 'k', '>1%'), (0.005, 'C0', '1-0.5%'), (0.002, 'C1', '0.5-0.2%'),
+                   (0.0005, 'C2', '0.2-0.05%'), (0.0001, 'C3', '0.05-0.01%'), (None, 'C4', '<0.01%')]
+
+# reference lines of the inspection plot: intensity, color, label
+INSPECT_LINES = [(0.01, 'C0', "1% line"), (0.005, 'C1', "0.5% line"), (0.002, 'C2', "0.2% line"),
+                 (0.0005, 'C3', "0.05% line"), (0.0001, 'C4', "0.01% line")]
+
+
+def inspectClasses(mz, intensity):
+    # peaks split by relative intensity, upper bounds inclusive
+    classes = []
+    upper = np.inf
+    for lower, color, label in INSPECT_CLASSES:
+        if lower is None:
+            mask = intensity <= upper
+        else:
+            mask = (intensity > lower) & (intensity <= upper)
+        classes.append((mz[mask], intensity[mask], color))
+        upper = lower
+
+    return classes
+
+
+def drawInspect(fig, record):
+    from matplotlib.ticker import FuncFormatter
+
+    classes = inspectClasses(np.asarray(record['x']), np.asarray(record['y']))
+    counts = [len(x) for x, y, color in classes]
+
+    title = str("Peak list information for " + str(record['basename']) + "\n" +
+                "Total number of peaks: " + str(sum(counts)) + ",  " +
+                "COM=" + record['com'] + "\n" +
+                "Relative intensity " + "; ".join(
+                    label + ", " + str(n) + " peaks" for (l, c, label), n in zip(INSPECT_CLASSES, counts)) + "\n" +
+                "Black plots: higer than 1%, blue: 1-0.5%, orange: 0.5-0.2%, green: 0.2-0.05, red: 0.05-0.01%, purple: < 0.01%")
+    fig.suptitle(title, fontsize=12, x=fig.subplotpars.left, ha='left')
+
+    for n, scale in enumerate(['linear', 'log']):
+        ax = fig.add_subplot(2, 1, n + 1)
+        ax.set_yscale(scale)
+        drawStems(ax, classes)
+
+        for value, color, text in INSPECT_LINES:
+            ax.hlines(value, 0, 20000, color, linestyles='dashed', lw=0.5)
+            ax.text(50, value, text, size=10, color=color)
+
+        ax.grid(True, axis="y", color='black', linestyle=':', linewidth=0.5)
+        ax.xaxis.set_major_formatter(FuncFormatter(
+            lambda x, loc: "{:,}".format(int(x))))
+        if scale == 'linear':
+            ax.set_ylim(0,)
+        ax.set_xlim(0, 15000)
+        ax.set_xlabel("m/z", fontsize=14)
+        ax.set_ylabel("intensity (" + scale + ", -)", fontsize=14)
+
+
+renderers = {}
+
+
+def renderLocal(record):
+    # plots of the single-file workflows share one figure per process
+    if 'local' not in renderers:
+        renderers['local'] = Renderer()
+
+    return renderers['local'].render(record)
+
+
+def rendererThread(queueIn):
+    logger = logging.getLogger('GPMsDB_tk')
+    renderer = Renderer()
+    while True:
+        record = queueIn.get(block=True, timeout=None)
+        if record is None:
+            break
+
+        try:
+            renderer.render(record)
+        except Exception as e:
+            logger.error('Rendering failed for ' + record['outfile'] + ': ' + str(e))
+
+
+class RendererPool(object):
+    """Renderer processes consuming plot records from a queue, so that the
+    identification workers never wait for figures to be drawn."""
+
+    def __init__(self, processes):
+        self.queue = mp.Queue()
+        self.procs = [mp.Process(target=rendererThread, args=(self.queue,))
+                      for _ in range(processes)]
+        for p in self.procs:
+            p.start()
+
+    def close(self):
+        for _ in self.procs:
+            self.queue.put(None)
+        for p in self.procs:
+            p.join()
+
+    def terminate(self):
+        for p in self.procs:
+            p.terminate()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+__author__ = 'Yuji Sekiguchi'
+__copyright__ = 'Copyright (c) 2023 Yuji Sekiguchi, National Institute of Advanced Industrial Science and Technology (AIST)'
+__credits__ = ['Yuji Sekiguchi']
+__license__ = 'GPL3.0'
+__maintainer__ = 'Yuji Sekiguchi'
+__email__ = 'y.sekiguchi@aist.go.jp'
+__status__ = 'Development'
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+
+import numpy as np
+
+from GPMsDB_tk import __version__
+from GPMsDB_tk.defaultValues import DefaultValues
+from GPMsDB_tk.background import backgroundPath
+
+# options that change the result of adjust/identify for the same peaks
+SEARCH_OPTIONS = ['reference', 'taxonomy', 'ppm', 'first', 'top', 'score_type', 'minimum',
+                  'adjust', 'auto_adjust', 'ppm_range', 'number_of_bins', 'calibration',
+                  'engine', 'background', 'seed']
+
+
+def jsonValue(o):
+    # numpy scalars
+    return o.item()
+
+
+class ResultCache(object):
+    """Search results kept in an SQLite file across runs.
+
+    Entries are keyed by the selected peaks of a peak list together with the
+    search options, the database fingerprint and the program version, and
+    hold the m/z adjustment, the search summary and the ranked table. The
+    least recently used entries are evicted beyond max_bytes/max_entries.
+    """
+
+    def __init__(self, path, params, max_bytes=DefaultValues.CACHE_SIZE * 1024 * 1024,
+                 max_entries=DefaultValues.CACHE_ENTRIES):
+        self.logger = logging.getLogger('GPMsDB_tk')
+        self.path = path
+        self.params = json.dumps(dict(params, version=__version__),
+                                 sort_keys=True, default=jsonValue)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.conn = None
+
+    def __getstate__(self):
+        # worker processes open their own connection
+        state = self.__dict__.copy()
+        state['conn'] = None
+        return state
+
+    def connect(self):
+        if self.conn is None:
+            cache_dir = os.path.dirname(os.path.abspath(self.path))
+            if not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            self.conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, '
+                              'value TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)')
+
+        return self.conn
+
+    def key(self, peaks, t_peak, t_use, com):
+        h = hashlib.sha256(self.params.encode('utf-8'))
+        h.update(np.asarray(peaks, dtype='<f8').tobytes())
+        h.update(json.dumps([t_peak, t_use, com], default=jsonValue).encode('utf-8'))
+
+        return h.hexdigest()
+
+    def get(self, key):
+        # a cache that cannot be read is only a slower run
+        try:
+            conn = self.connect()
+            row = conn.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute('UPDATE results SET accessed = ? WHERE key = ?', (time.time(), key))
+        except sqlite3.Error as e:
+            self.logger.warning('Result cache not readable (' + str(e) + '): ' + self.path)
+            return None
+
+        return json.loads(row[0])
+
+    def put(self, key, result):
+        value = json.dumps(result, default=jsonValue)
+        try:
+            conn = self.connect()
+            conn.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                         (key, value, len(value), time.time()))
+            self.evict()
+        except sqlite3.Error as e:
+            self.logger.warning('Result cache not writable (' + str(e) + '): ' + self.path)
+
+    def evict(self):
+        # least recently used entries beyond the entry and the size limits
+        self.conn.execute('DELETE FROM results WHERE key IN (SELECT key FROM results '
+                          'ORDER BY accessed DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+        self.conn.execute('DELETE FROM results WHERE key IN (SELECT key FROM (SELECT key, '
+                          'SUM(size) OVER (ORDER BY accessed DESC, key) AS total FROM results) '
+                          'WHERE total > ?)', (self.max_bytes,))
+
+
+def lookupCache(cache, peaks, t_peak, t_use, com):
+    # key and cached result (None) of a peak list
+    if cache is None:
+        return None, None
+
+    key = cache.key(peaks, t_peak, t_use, com)
+
+    return key, cache.get(key)
+
+
+def storeCache(cache, key, search):
+    if cache is not None:
+        cache.put(key, {'summary': search.summary, 'table': search.table})
+
+
+def openCache(options, bundle):
+    # None unless --cache is given
+    if getattr(options, 'cache', None) is None:
+        return None
+
+    params = {name: getattr(options, name, None) for name in SEARCH_OPTIONS}
+    params['databases'] = bundle.fingerprint()
+    if params['background'] == 'table':
+        path = backgroundPath(options.reference)
+        if os.path.isfile(path):
+            st = os.stat(path)
+            params['databases'].append([os.path.basename(path), st.st_size, st.st_mtime_ns])
+
+    return ResultCache(options.cache, params, max_bytes=int(options.cache_size * 1024 * 1024))
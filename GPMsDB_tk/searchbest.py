@@ -10,11 +10,13 @@ __status__ = 'Development'
 
 import os
 import sys
+import math
 import logging
 import statistics
-from GPMsDB_tk.calc import CalcHit, CalcScore, CalcRamdom
+import numpy as np
+from GPMsDB_tk.calcvec import CalcHitDb, CalcHitSubset, CalcBitsetShifts, CalcScoreArray, TopIndices, RestIndices
 from GPMsDB_tk.defaultValues import DefaultValues
-from scipy import stats
+from GPMsDB_tk.background import Background
 
 
 class SearchBestHit(object):
@@ -22,11 +24,29 @@ class SearchBestHit(object):
         self.logger = logging.getLogger('GPMsDB_tk')
 
     def run(self, input_file, reference, peaks, ppm, first, top, score_type, adjust, reps_db, 
-        all_db, tax, ncbi, strain, com, genes, taxonomy, t_peak, t_use, minimum):
-        # first search
+        all_db, tax, ncbi, strain, com, genes, taxonomy, t_peak, t_use, minimum, first_hits=None,
+        background=None, engine='exact'):
+        # first search (batch workflows pass the hits scored with CalcHitBatch
+        # or CalcBitsetBatch); the ms score needs the exact deviations
         self.logger.info('[identify] 1st search.')
 
-        hit, exact = CalcHit(self, peaks, adjust, ppm, 1, reps_db, score_type)
+        screened = engine == 'bitset' and score_type != 'ms'
+        if first_hits is not None:
+            hit, exact = first_hits
+        elif screened:
+            hit, exact = CalcBitsetShifts(self, peaks, adjust, ppm, [1], reps_db)
+            hit, exact = hit[0], exact[0]
+        else:
+            hit, exact = CalcHitDb(
+                self, peaks, adjust, ppm, 1, reps_db, score_type, use_index=True)
+        if screened:
+            # bitset hits only select the genomes, which are scored again
+            hit = np.array(hit)
+            exact = np.array(exact)
+
+        # hits and scores are vectors aligned to the genome index of reps_db
+        ids = reps_db.ids
+        gene = reps_db.column('genes', genes)
 
         ramd = 0
         num1 = DefaultValues.HIT_EXCLUDE_REP
@@ -40,64 +60,64 @@ class SearchBestHit(object):
             prob2 = DefaultValues.PROBABIL_ALL_90
             prob3 = DefaultValues.PROBABIL_ALL_99
 
-        result = sorted(hit.items(), key=lambda x: x[1], reverse=True)[
-            :int(first)]
+        # partial selection instead of full sorts; the random sampling pool
+        # (genomes outside the top hits) is kept in database order
+        result = TopIndices(hit, first)
         if reference == 'reps':
-            result_s = sorted(hit.items(), key=lambda x: x[1], reverse=True)[
-                num1:]
+            result_s = RestIndices(hit, num1)
             if len(result_s) == 0:
-                result_s = sorted(
-                    hit.items(), key=lambda x: x[1], reverse=True)
+                result_s = np.arange(len(hit))
             if len(result_s) <= 100:
                 print(
                     'number of candidates from the 1st screening too low: ', input_file)
                 ramd = 1
         elif reference == 'all' or 'custom':
-            result_s = sorted(hit.items(), key=lambda x: x[1], reverse=True)[
-                num2:]
+            result_s = RestIndices(hit, num2)
             if len(result_s) == 0:
-                result_s = sorted(hit.items(), key=lambda x: x[1], reverse=True)[
-                    num3:]
+                result_s = RestIndices(hit, num3)
             if len(result_s) <= 100:
                 print('number of candidates from the 1st screening too low: ', input_file)
                 ramd = 1
 
-        dic = dict(result)
+        if screened:
+            hit[result], exact[result] = CalcHitSubset(
+                self, peaks, adjust, ppm, 1, reps_db, result, score_type)
 
-        # second search
+        # second search, read straight from the shared all_db arrays
         self.logger.info('[identify] 2nd search.')
-        all_db_limit = {}
-        for h in dic.keys():
-            all_db_limit[h] = []
-            all_db_limit[h] = all_db[h]
-
-        hit_all, exact_all = CalcHit(
-            self, peaks, adjust, ppm, 1, all_db_limit, score_type)
+        to_all = all_db.align(reps_db)
+        hit_all, exact_all = CalcHitSubset(
+            self, peaks, adjust, ppm, 1, all_db, to_all[result], score_type)
 
         # Calculating score
         self.logger.info('[identify] Calculating score.')
-        scores = {}
-        scores = CalcScore(self, score_type, hit, hit_all,
-                           exact, exact_all, genes)
+        scores = CalcScoreArray(score_type, hit[result], hit_all,
+                                exact[result], exact_all, gene[result])
 
-        result2 = sorted(scores.items(), key=lambda x: x[1], reverse=True)[
-            :int(top)]
-        dic2 = dict(result2)
+        valid = np.flatnonzero(~np.isnan(scores))
+        result2 = valid[TopIndices(scores[valid], top)]
 
         # random sampling
-        if ramd == 0:
+        if background is None:
+            background = Background()
+        null = background.lookup(score_type, len(peaks), ppm)
+        if ramd == 0 and null is not None:
+            self.logger.info(
+                '[identify] Random sampling scores from the precomputed background.')
+            mean, stdev = null
+        elif ramd == 0:
             self.logger.info(
                 '[identify] Calculating scores from ramdomly selected genomes.')
 
-            ramdom_list = list(result_s)
-            hit_all2, exact_all2 = CalcRamdom(
-                self, ramdom_list, peaks, adjust, ppm, 1, all_db, score_type)
-            scores2 = {}
-            scores2 = CalcScore(self, score_type, hit,
-                                hit_all2, exact, exact_all2, genes)
-            ramdomscore = []
-            for cc in scores2.keys():
-                ramdomscore.append(scores2[cc])
+            sample = background.sample(reps_db, result_s)
+            if screened:
+                hit[sample], exact[sample] = CalcHitSubset(
+                    self, peaks, adjust, ppm, 1, reps_db, sample, score_type)
+            hit_all2, exact_all2 = CalcHitSubset(
+                self, peaks, adjust, ppm, 1, all_db, to_all[sample], score_type, by_mass=True)
+            scores2 = CalcScoreArray(score_type, hit[sample], hit_all2,
+                                     exact[sample], exact_all2, gene[sample])
+            ramdomscore = scores2[~np.isnan(scores2)].tolist()
 
             mean = statistics.mean(ramdomscore)
             stdev = statistics.stdev(ramdomscore)
@@ -107,30 +127,23 @@ class SearchBestHit(object):
 
         # output
         self.logger.info("Searching done.")
-        dir, filename = os.path.split(input_file)
-        self.logger.info('#Search result here: with m/z adjustment of ' +
-                         str("{:.1f}".format(adjust)) + " ppm")
-        self.logger.info('#Input: ' + str(t_peak) + ' peaks found, ' + str(t_use) +
-                         ' peaks used with relative intensity higher than ' + str(round(minimum, 5)))
-        self.logger.info('#Tolerance: ' + str(ppm) +
-                         ' ppm; Input file: ' + str(filename))
-        self.logger.info('#Score type: ' + str(score_type) +
-                         '; Reference type: ' + str(reference))
-        self.logger.info('#Random sampling score: ' + str(round(mean, 2)
-                                                          ) + '; standard dev: ' + str(round(stdev, 2)))
-        if not com == '':
-            self.logger.info('#' + str(com))
-        self.logger.info(
-            '#Genome Id\tprotein_hit\tribosomal_hit\tscore\tprobability\tlikelihood(%)\tncbi_name\tncbi_strain\ttaxonomy_' + str(taxonomy))
-        a = 0
-        for k in dic2:
+        self.summary = {'adjust': adjust, 'total_peaks': t_peak, 'used_peaks': t_use,
+                        'minimum': minimum, 'ppm': ppm, 'score_type': score_type,
+                        'reference': reference, 'taxonomy': taxonomy, 'random_mean': mean,
+                        'random_stdev': stdev, 'com': com}
+        self.table = []
+        for n in result2:
+            k = ids[result[n]]
+            ribosomal_hit = int(hit[result[n]])
+            protein_hit = ribosomal_hit + int(hit_all[n])
+            score = float(scores[n])
             if stdev == 0:
                 stdev = 0.01
             if reference == "reps":
-                upper = stats.norm.pdf(x=scores[k], loc=(mean), scale=(stdev*1.5))
+                upper = normPdf(score, mean, stdev*1.5)
             else:
-                upper = stats.norm.pdf(x=scores[k], loc=(mean), scale=(stdev*2))
-            if hit[k] > prob1:
+                upper = normPdf(score, mean, stdev*2)
+            if ribosomal_hit > prob1:
                 likel = "50%"
                 if upper < prob2:
                     likel = "90%"
@@ -152,13 +165,58 @@ class SearchBestHit(object):
             except KeyError:
                 strain_name = "not assigned"
 
-            self.logger.info(str(k) + '\t' + str(hit[k] + hit_all[k]) + '\t' + str(hit[k]) + '\t' + str(round(scores[k], 3)) + '\t' + str(
-                "{:.2e}".format(upper)) + '\t' + likel + '\t' + ncbi_name + '\t' + strain_name + '\t' + show_tax)
+            self.table.append({'genome_id': k,
+                               'protein_hit': protein_hit,
+                               'ribosomal_hit': ribosomal_hit,
+                               'score': score,
+                               'probability': float(upper),
+                               'likelihood': likel,
+                               'ncbi_name': ncbi_name,
+                               'ncbi_strain': strain_name,
+                               'taxonomy': show_tax})
+
+        return self.report(input_file)
+
+    def replay(self, input_file, result):
+        # a result from the cache in place of run()
+        self.summary = result['summary']
+        self.table = result['table']
+
+        return self.report(input_file)
+
+    def report(self, input_file):
+        # output of summary and table; also replays results of the cache
+        s = self.summary
+        dir, filename = os.path.split(input_file)
+        self.logger.info('#Search result here: with m/z adjustment of ' +
+                         str("{:.1f}".format(s['adjust'])) + " ppm")
+        self.logger.info('#Input: ' + str(s['total_peaks']) + ' peaks found, ' + str(s['used_peaks']) +
+                         ' peaks used with relative intensity higher than ' + str(round(s['minimum'], 5)))
+        self.logger.info('#Tolerance: ' + str(s['ppm']) +
+                         ' ppm; Input file: ' + str(filename))
+        self.logger.info('#Score type: ' + str(s['score_type']) +
+                         '; Reference type: ' + str(s['reference']))
+        self.logger.info('#Random sampling score: ' + str(round(s['random_mean'], 2)
+                                                          ) + '; standard dev: ' + str(round(s['random_stdev'], 2)))
+        if not s['com'] == '':
+            self.logger.info('#' + str(s['com']))
+        self.logger.info(
+            '#Genome Id\tprotein_hit\tribosomal_hit\tscore\tprobability\tlikelihood(%)\tncbi_name\tncbi_strain\ttaxonomy_' + str(s['taxonomy']))
+        a = 0
+        for h in self.table:
+            self.logger.info(str(h['genome_id']) + '\t' + str(h['protein_hit']) + '\t' + str(h['ribosomal_hit']) + '\t' + str(round(h['score'], 3)) + '\t' + str(
+                "{:.2e}".format(h['probability'])) + '\t' + h['likelihood'] + '\t' + h['ncbi_name'] + '\t' + h['ncbi_strain'] + '\t' + h['taxonomy'])
             if a == 0:
-                genome_ref = k
+                genome_ref = h['genome_id']
             a += 1
 
         self.logger.info(
             "Best matched genome is predicted to be: " + genome_ref)
 
         return genome_ref
+
+
+def normPdf(x, loc, scale):
+    # density of the normal distribution, as scipy.stats.norm.pdf
+    z = (x - loc) / scale
+    return math.exp(-z * z / 2) / math.sqrt(2 * math.pi) / scale
@@ -11,7 +11,9 @@ __status__ = 'Development'
 
 import logging
 
-from GPMsDB_tk.calc import CalcHit, CalcScore, CalcScore2, CalcRamdom
+import numpy as np
+
+from GPMsDB_tk.calcvec import CalcHitDb, CalcScoreArray
 from GPMsDB_tk.defaultValues import DefaultValues
 
 
@@ -24,23 +26,24 @@ class SearchBestHit2(object):
         # first search
         self.logger.info('[identify] 1st search.')
 
-        hit, exact = CalcHit(self, peaks, adjust, ppm, 1, reps_db, score_type)
+        hit, exact = CalcHitDb(self, peaks, adjust, ppm, 1, reps_db, score_type)
 
         # second search
         self.logger.info('[identify] 2nd search.')
 
-        hit_all, exact_all = CalcHit(
+        hit_all, exact_all = CalcHitDb(
             self, peaks, adjust, ppm, 1, all_db, score_type)
 
         # Calculating score
         self.logger.info('[identify] Calculating score.')
-        scores = {}
-        if no_gen == "limit":
-            scores = CalcScore(self, score_type, hit,
-                               hit_all, exact, exact_all, genes)
-        elif no_gen == "linear":
-            scores = CalcScore2(self, score_type, hit,
-                                hit_all, exact, exact_all, genes)
+        # scores are aligned to all_db.ids; genomes missing from reps_db or
+        # without a gene count are NaN
+        pos = reps_db.positions(all_db.ids)
+        found = pos >= 0
+        pos = np.where(found, pos, 0)
+        gene = np.where(found, all_db.column('genes', genes), np.nan)
+        scores = CalcScoreArray(score_type, hit[pos], hit_all, exact[pos],
+                                exact_all, gene, limit=(no_gen == "limit"))
 
         # output
         self.logger.info("Searching done.")
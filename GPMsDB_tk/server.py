@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+
+__author__ = 'Yuji Sekiguchi'
+__copyright__ = 'Copyright (c) 2023 Yuji Sekiguchi, National Institute of Advanced Industrial Science and Technology (AIST)'
+__credits__ = ['Yuji Sekiguchi']
+__license__ = 'GPL3.0'
+__maintainer__ = 'Yuji Sekiguchi'
+__email__ = 'y.sekiguchi@aist.go.jp'
+__status__ = 'Development'
+
+import os
+import sys
+import json
+import logging
+import tempfile
+import urllib.request
+import urllib.error
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from GPMsDB_tk.common import readPeakList, makeSurePathExists
+from GPMsDB_tk.defaultValues import DefaultValues
+from GPMsDB_tk.adjustmz import AdjustMZ
+from GPMsDB_tk.bundle import DatabaseBundle
+from GPMsDB_tk.peakparser import PeakParser
+from GPMsDB_tk.searchbest import SearchBestHit
+from GPMsDB_tk.background import Background, loadBackground
+
+
+class IdentifyServer(object):
+    """Keeps the reference databases resident and runs adjust/identify/peak
+    for peak lists posted over a local HTTP API."""
+
+    def __init__(self, reference, taxonomy, seed=DefaultValues.RANDOM_SEED, background='sample'):
+        self.logger = logging.getLogger('GPMsDB_tk')
+        self.reference = reference
+        self.taxonomy = taxonomy
+
+        self.logger.info('[serve] Loading databases.')
+        bundle = DatabaseBundle(reference, taxonomy)
+        bundle.prefetch('reps', 'all', 'tax', 'ncbi', 'strain', 'genes')
+
+        self.reps = bundle.reps
+        self.all = bundle.all
+        self.tax = bundle.tax
+        self.tax_adjust = bundle.ncbi
+        self.strain = bundle.strain
+        self.genes = bundle.genes
+
+        # the m/z adjustment runs on the ribosomal set of the reference
+        # (custom genomes included), as in identify_wf
+        self.reps_adjust = self.reps
+
+        if background == 'table':
+            self.background = loadBackground(reference, self.reps, seed)
+        else:
+            self.background = Background(seed)
+
+    def loadPeaks(self, request, minimum, tmp_dir):
+        # peak lists are posted as the text of a peak-list file
+        name = os.path.basename(request.get('name', 'peaklist.txt'))
+        input_file = os.path.join(tmp_dir, name)
+        with open(input_file, 'w') as f:
+            f.write(request['peaks'])
+
+        peaklist = readPeakList(input_file)
+        peaks, t_peak, p_use, com = peaklist.load(minimum)
+
+        return input_file, peaklist, list(peaks.keys()), t_peak, p_use, com
+
+    def adjust(self, request, list_peaks):
+        if request.get('auto_adjust', False):
+            p = AdjustMZ()
+            return p.run(list_peaks,
+                         request.get('ppm_range', DefaultValues.CHECK_RANGE),
+                         request.get('number_of_bins', DefaultValues.NO_BIN),
+                         self.reps_adjust,
+                         self.tax_adjust,
+                         request.get('calibration', 'bins'),
+                         request.get('engine', 'exact'))
+
+        return request.get('adjust', 0)
+
+    def identify(self, request, tmp_dir):
+        minimum = request.get('minimum', DefaultValues.MIN_PEAK)
+        ppm = request.get('ppm', DefaultValues.TORELANCE)
+        input_file, peaklist, list_peaks, t_peak, p_use, com = self.loadPeaks(
+            request, minimum, tmp_dir)
+        if len(list_peaks) == 0:
+            return {'error': 'Peaks not found.'}
+
+        adjust = self.adjust(request, list_peaks)
+
+        p = SearchBestHit()
+        best = p.run(input_file,
+                     self.reference,
+                     list_peaks,
+                     ppm,
+                     request.get('first', DefaultValues.HIT_RETAIN_FST),
+                     request.get('top', DefaultValues.HIT_SHOW),
+                     request.get('score_type', 'weighted'),
+                     adjust,
+                     self.reps,
+                     self.all,
+                     self.tax,
+                     self.tax_adjust,
+                     self.strain,
+                     com,
+                     self.genes,
+                     self.taxonomy,
+                     t_peak,
+                     p_use,
+                     minimum,
+                     background=self.background,
+                     engine=request.get('engine', 'exact'))
+
+        result = {'input': os.path.basename(input_file), 'best': best}
+        result.update(p.summary)
+        result['hits'] = p.table
+
+        if request.get('out_dir'):
+            makeSurePathExists(request['out_dir'])
+            p = PeakParser()
+            result['plot'] = p.run(input_file,
+                                   self.reference,
+                                   request['out_dir'],
+                                   ppm,
+                                   request.get('genome_ref', best),
+                                   adjust,
+                                   request.get('filetype', 'png'),
+                                   DefaultValues.GENOME_DIR,
+                                   peaklist)
+
+        return result
+
+    def adjustOnly(self, request, tmp_dir):
+        minimum = request.get('minimum', DefaultValues.MIN_PEAK)
+        input_file, peaklist, list_peaks, t_peak, p_use, com = self.loadPeaks(
+            request, minimum, tmp_dir)
+        if len(list_peaks) == 0:
+            return {'error': 'Peaks not found.'}
+
+        request = dict(request, auto_adjust=True)
+
+        return {'input': os.path.basename(input_file),
+                'adjust': self.adjust(request, list_peaks)}
+
+    def run(self, host, port):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def reply(self, code, result):
+                body = json.dumps(result).encode('utf-8')
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == '/status':
+                    self.reply(200, {'status': 'ok', 'reference': server.reference,
+                                     'taxonomy': server.taxonomy})
+                else:
+                    self.reply(404, {'error': 'Unknown path: ' + self.path})
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                try:
+                    request = json.loads(self.rfile.read(length).decode('utf-8'))
+                    with tempfile.TemporaryDirectory(prefix='GPMsDB_tk_') as tmp_dir:
+                        if self.path == '/identify':
+                            self.reply(200, server.identify(request, tmp_dir))
+                        elif self.path == '/adjust':
+                            self.reply(200, server.adjustOnly(request, tmp_dir))
+                        else:
+                            self.reply(404, {'error': 'Unknown path: ' + self.path})
+                except (Exception, SystemExit) as e:
+                    server.logger.error('Request failed: ' + repr(e))
+                    self.reply(500, {'error': repr(e)})
+
+            def log_message(self, format, *args):
+                server.logger.debug(format % args)
+
+        httpd = HTTPServer((host, port), Handler)
+        self.logger.info('[serve] Listening on http://' +
+                         host + ':' + str(port) + ' (Ctrl-C to stop).')
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        httpd.server_close()
+
+
+def requestServer(host, port, command, request):
+    url = 'http://' + host + ':' + str(port) + '/' + command
+    data = json.dumps(request).encode('utf-8')
+    req = urllib.request.Request(
+        url, data=data, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req) as res:
+            return json.loads(res.read().decode('utf-8'))
+    except urllib.error.HTTPError as e:
+        return json.loads(e.read().decode('utf-8'))
+    except urllib.error.URLError as e:
+        logger = logging.getLogger('GPMsDB_tk')
+        logger.error('GPMsDB-tk server not reachable at ' + url + ': ' + str(e.reason))
+        sys.exit(1)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+
+__author__ = 'Yuji Sekiguchi'
+__copyright__ = 'Copyright (c) 2023 Yuji Sekiguchi, National Institute of Advanced Industrial Science and Technology (AIST)'
+__credits__ = ['Yuji Sekiguchi']
+__license__ = 'GPL3.0'
+__maintainer__ = 'Yuji Sekiguchi'
+__email__ = 'y.sekiguchi@aist.go.jp'
+__status__ = 'Development'
+
+import os
+import re
+import sys
+import zlib
+import base64
+import logging
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from GPMsDB_tk.common import makePeakList, checkFileExists
+
+# multi-spectrum containers, by (lower case) file extension
+CONTAINERS = {'.mzml': 'mzml', '.mzxml': 'mzxml', '.mgf': 'mgf',
+              '.h5': 'hdf5', '.hdf5': 'hdf5'}
+
+# mzML controlled vocabulary of the binary data arrays
+CV_MZ = 'MS:1000514'
+CV_INTENSITY = 'MS:1000515'
+CV_FLOAT32 = 'MS:1000521'
+CV_FLOAT64 = 'MS:1000523'
+CV_ZLIB = 'MS:1000574'
+CV_NUMPRESS = ('MS:1002312', 'MS:1002313', 'MS:1002314',
+               'MS:1002746', 'MS:1002747', 'MS:1002748')
+
+
+def containerFormat(path):
+    return CONTAINERS.get(os.path.splitext(path)[1].lower())
+
+
+def localName(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def spectrumName(path, key, seen):
+    # "<container>_<spectrum>" with characters unsafe in file names replaced,
+    # made unique within the container
+    stem = os.path.splitext(os.path.basename(path))[0]
+    name = stem + '_' + re.sub(r'[^0-9A-Za-z_\-]+', '_', str(key)).strip('_')
+    if name in seen:
+        name = name + '_' + str(len(seen))
+    seen.add(name)
+
+    return os.path.join(os.path.dirname(path), name)
+
+
+def decodeArray(text, dtype, compressed):
+    data = base64.b64decode(text.strip()) if text else b''
+    if compressed:
+        data = zlib.decompress(data)
+
+    return np.frombuffer(data, dtype=dtype).astype(np.float64)
+
+
+def readMzML(path):
+    logger = logging.getLogger('GPMsDB_tk')
+
+    seen = set()
+    arrays = {}
+    array = None
+    for event, elem in ET.iterparse(path, events=('start', 'end')):
+        tag = localName(elem.tag)
+        if event == 'start':
+            if tag == 'spectrum':
+                arrays = {}
+            elif tag == 'binaryDataArray':
+                array = {'dtype': '<f8', 'compressed': False, 'kind': None}
+            continue
+
+        if tag == 'cvParam' and array is not None:
+            acc = elem.get('accession')
+            if acc == CV_MZ:
+                array['kind'] = 'mz'
+            elif acc == CV_INTENSITY:
+                array['kind'] = 'intensity'
+            elif acc == CV_FLOAT32:
+                array['dtype'] = '<f4'
+            elif acc == CV_FLOAT64:
+                array['dtype'] = '<f8'
+            elif acc == CV_ZLIB:
+                array['compressed'] = True
+            elif acc in CV_NUMPRESS:
+                logger.error('Unsupported compression of binary data arrays (' +
+                             elem.get('name', acc) + '): ' + path)
+                sys.exit(1)
+        elif tag == 'binary' and array is not None:
+            array['text'] = elem.text
+        elif tag == 'binaryDataArray':
+            if array['kind'] is not None:
+                arrays[array['kind']] = decodeArray(
+                    array.get('text'), array['dtype'], array['compressed'])
+            array = None
+        elif tag == 'spectrum':
+            if 'mz' in arrays and 'intensity' in arrays:
+                key = elem.get('spotID') or elem.get('id') or elem.get('index')
+                yield spectrumName(path, key, seen), makePeakList(arrays['mz'], arrays['intensity'])
+            elem.clear()
+
+
+def readMzXML(path):
+    seen = set()
+    scans = []
+    for event, elem in ET.iterparse(path, events=('start', 'end')):
+        tag = localName(elem.tag)
+        if event == 'start':
+            if tag == 'scan':
+                scans.append(elem.get('num'))
+            elif tag == 'maldi' and scans:
+                scans[-1] = elem.get('spotID') or scans[-1]
+            continue
+
+        if tag == 'peaks':
+            dtype = ('>f' if elem.get('byteOrder', 'network') == 'network' else '<f') + \
+                str(int(elem.get('precision', '32')) // 8)
+            pairs = decodeArray(elem.text, dtype, elem.get('compressionType', 'none') == 'zlib')
+            yield spectrumName(path, scans[-1], seen), makePeakList(pairs[0::2], pairs[1::2])
+            elem.clear()
+        elif tag == 'scan':
+            scans.pop()
+            elem.clear()
+
+
+def readMgf(path):
+    # BEGIN IONS / END IONS blocks of "m/z intensity" lines; TITLE= names the
+    # spectrum and COM= is kept as the comment of plain peak lists
+    seen = set()
+    n = 0
+    block = None
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line == '' or line[0] in '#;!/':
+                continue
+            if line == 'BEGIN IONS':
+                block = {'title': None, 'com': '', 'mz': [], 'intensity': []}
+            elif line == 'END IONS':
+                n += 1
+                key = block['title'] or n
+                yield spectrumName(path, key, seen), makePeakList(
+                    np.array(block['mz'], dtype=np.float64),
+                    np.array(block['intensity'], dtype=np.float64), block['com'])
+                block = None
+            elif block is None:
+                continue
+            elif line.startswith('TITLE='):
+                block['title'] = line[6:]
+            elif line.startswith('COM='):
+                block['com'] = line[4:]
+            elif '=' in line:
+                continue
+            else:
+                element = line.split()
+                block['mz'].append(float(element[0]))
+                block['intensity'].append(float(element[1]) if len(element) > 1 else 1)
+
+
+def readHdf5(path):
+    # one group per spectrum holding "mz" and "intensity" datasets
+    try:
+        import h5py
+    except ImportError:
+        logger = logging.getLogger('GPMsDB_tk')
+        logger.error('h5py is required to read HDF5 containers: ' + path)
+        sys.exit(1)
+
+    seen = set()
+    with h5py.File(path, 'r') as f:
+        for key in f:
+            group = f[key]
+            com = group.attrs.get('com', '')
+            if isinstance(com, bytes):
+                com = com.decode()
+            yield spectrumName(path, key, seen), makePeakList(
+                np.asarray(group['mz'], dtype=np.float64),
+                np.asarray(group['intensity'], dtype=np.float64), str(com))
+
+
+def iterSpectra(path):
+    checkFileExists(path)
+
+    fmt = containerFormat(path)
+    if fmt == 'mzml':
+        return readMzML(path)
+    elif fmt == 'mzxml':
+        return readMzXML(path)
+    elif fmt == 'mgf':
+        return readMgf(path)
+    elif fmt == 'hdf5':
+        return readHdf5(path)
+
+
+def readInputList(input_list):
+    # a container given in place of the list stands for all of its spectra
+    if containerFormat(input_list) is not None:
+        return [input_list]
+
+    peaklist_files = []
+    for line in open(input_list, encoding='utf-8'):
+        if line.startswith("#"):
+            continue
+        elif line == "":
+            continue
+
+        element = line.split("\t")
+        peaklist_files.append(element[0].strip())
+
+    return peaklist_files
+
+
+def iterInputs(peaklist_files):
+    # (name, PeakList) of every spectrum of the containers, read sequentially;
+    # plain peak-list files are passed on as (path, None) and read by workers
+    for in_file in peaklist_files:
+        if containerFormat(in_file) is None:
+            yield in_file, None
+        else:
+            for name, peaklist in iterSpectra(in_file):
+                yield name, peaklist
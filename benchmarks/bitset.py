@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+__author__ = 'Yuji Sekiguchi'
+__copyright__ = 'Copyright (c) 2023 Yuji Sekiguchi, National Institute of Advanced Industrial Science and Technology (AIST)'
+__credits__ = ['Yuji Sekiguchi']
+__license__ = 'GPL3.0'
+__maintainer__ = 'Yuji Sekiguchi'
+__email__ = 'y.sekiguchi@aist.go.jp'
+__status__ = 'Development'
+
+# Agreement and speed of the bitset engine (-e bitset): scores synthetic
+# peak lists drawn from the genomes of a ribosomal mass table with the
+# exact hits (m/z index) and the bitset hits, as in the 1st search, and
+# compares the counts and the genomes retained by the screening. Fails when
+# the top hit differs for more than --max_changed of the peak lists.
+#
+#   python benchmarks/bitset.py [mass/ribosomal.db] [-n 100] [-p 200]
+
+import os
+import sys
+import time
+import pickle
+import argparse
+
+import numpy as np
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from GPMsDB_tk.defaultValues import DefaultValues
+from GPMsDB_tk.massdb import MassDB
+from GPMsDB_tk.massindex import getMassIndex
+from GPMsDB_tk.bitset import getBitsetIndex
+from GPMsDB_tk.calcvec import CalcHitArray, CalcBitsetShifts, TopIndices
+from common import peakLists
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Agreement of the bitset engine with the exact hits.')
+    parser.add_argument('db_file', nargs='?', default=None, help='pickled mass table (default: mass/ribosomal.db)')
+    parser.add_argument('-n', '--lists', type=int, default=100, help='synthetic peak lists')
+    parser.add_argument('-p', '--ppm', type=float, default=DefaultValues.TORELANCE, help='tolerance (ppm)')
+    parser.add_argument('-f', '--first', type=int, default=DefaultValues.HIT_RETAIN_FST, help='genomes retained by the screening')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the peak lists')
+    parser.add_argument('--max_changed', type=float, default=0.01, help='maximum fraction of peak lists with another top hit')
+    args = parser.parse_args()
+
+    db_file = args.db_file or DefaultValues.ALL_REPS_DB
+    with open(db_file, 'rb') as f:
+        db = MassDB.fromDict(pickle.load(f))
+
+    t = time.time()
+    index = getMassIndex(db)
+    t_index = time.time() - t
+    t = time.time()
+    bitset = getBitsetIndex(db)
+    t_bitset = time.time() - t
+
+    lists = peakLists(np.random.default_rng(args.seed), db, args.lists, 0.9 * args.ppm)
+    t = time.time()
+    exact = [CalcHitArray(p, 0, args.ppm, 1, db.masses, db.offsets, 'weighted', index)[0]
+             for p in lists]
+    t_exact = time.time() - t
+    t = time.time()
+    hits = [CalcBitsetShifts(None, p, 0, args.ppm, [1], db)[0][0] for p in lists]
+    t_hits = time.time() - t
+
+    differ = 0
+    lower = 0
+    dhit = 0
+    retained = 0
+    same_top = 0
+    for h0, h in zip(exact, hits):
+        differ += int(np.count_nonzero(h != h0))
+        lower += int(np.count_nonzero(h < h0))
+        dhit = max(dhit, int(np.abs(h - h0).max()))
+        retained += len(np.intersect1d(TopIndices(h0, args.first), TopIndices(h, args.first)))
+        same_top += int(h0[TopIndices(h, 1)[0]] == h0.max())
+
+    print('%d genomes, %d masses, %d bits of %g ppm' % (len(db), len(db.masses), len(bitset.bins),
+                                                         bitset.bin_ppm))
+    print('%-8s %10s %12s' % ('engine', 'index s', 'ms / list'))
+    print('%-8s %10.2f %12.3f' % ('exact', t_index, 1000 * t_exact / len(lists)))
+    print('%-8s %10.2f %12.3f' % ('bitset', t_bitset, 1000 * t_hits / len(lists)))
+    print('hits differ %d (%d below exact), max dhit %d, top %d retained %.2f%%, top1 %.1f%%' % (
+        differ, lower, dhit, args.first, 100 * retained / (len(lists) * min(args.first, len(db))),
+        100 * same_top / len(lists)))
+
+    changed = 1 - same_top / len(lists)
+    sys.exit(1 if changed > args.max_changed else 0)
+
+
+if __name__ == '__main__':
+    main()
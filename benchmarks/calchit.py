@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+__author__ = 'Yuji Sekiguchi'
+__copyright__ = 'Copyright (c) 2023 Yuji Sekiguchi, National Institute of Advanced Industrial Science and Technology (AIST)'
+__credits__ = ['Yuji Sekiguchi']
+__license__ = 'GPL3.0'
+__maintainer__ = 'Yuji Sekiguchi'
+__email__ = 'y.sekiguchi@aist.go.jp'
+__status__ = 'Development'
+
+# Regression check of the vectorised search (calcvec) against the Cython
+# matcher (calc.CalcHit/CalcRamdom): scores random peak lists against a
+# random mass table with both and fails on any difference in the hit
+# counts or the ms sums. The peak lists include repeated peaks, peaks with
+# overlapping windows and masses repeated within and across genomes, where
+# the greedy consumption order of CalcHit decides the hits. Needs the
+# compiled calc module (python setup.py build_ext --inplace).
+#
+#   python benchmarks/calchit.py [-n 200] [--seed 0]
+
+import os
+import sys
+import random
+import argparse
+
+import numpy as np
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from GPMsDB_tk.calc import CalcHit, CalcRamdom
+from GPMsDB_tk.massdb import MassDB
+from GPMsDB_tk.massindex import MassIndex
+from GPMsDB_tk.calcvec import (CalcHitArray, CalcHitShiftArray, CalcHitSubsetArray,
+                               CalcHitBatchArray)
+
+
+def massTable(rng, n_genomes):
+    # masses drawn from a shared pool (shared across genomes), some of
+    # them twice or a few ppm apart within a genome
+    pool = rng.uniform(2000, 20000, 4 * n_genomes)
+    db = {}
+    for g in range(n_genomes):
+        m = rng.choice(pool, rng.integers(20, 80))
+        close = rng.choice(m, 5) * (1 + rng.uniform(-20, 20, 5) / 1000000)
+        db['G%05d' % g] = sorted(np.concatenate((m, m[:3], close)).tolist())
+    return db
+
+
+def peakList(rng, db, ppm):
+    # masses of a genome moved within the tolerance, repeated peaks and
+    # clusters of peaks closer than the window width
+    own = np.asarray(db[rng.choice(list(db))])
+    own = rng.choice(own, min(len(own), 30), replace=False)
+    own = own * (1 + rng.uniform(-ppm, ppm, len(own)) / 1000000)
+    cluster = np.repeat(rng.choice(own, 3), 3) * (1 + rng.uniform(-ppm, ppm, 9) / 1000000)
+    peaks = np.concatenate((own, own[:3], cluster, rng.uniform(2000, 20000, 10)))
+    return sorted(peaks.tolist())
+
+
+def vectors(c, d, ids):
+    return np.array([c[g] for g in ids]), np.array([d[g] for g in ids])
+
+
+def same(name, h0, e0, h, e):
+    if np.array_equal(h0, h) and np.array_equal(e0, e):
+        return True
+    print('%s: %d hit counts and %d ms sums differ' % (
+        name, np.count_nonzero(h0 != h), np.count_nonzero(e0 != e)))
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Vectorised search against CalcHit/CalcRamdom.')
+    parser.add_argument('-n', '--lists', type=int, default=200, help='random peak lists')
+    parser.add_argument('-g', '--genomes', type=int, default=500, help='genomes of the mass table')
+    parser.add_argument('-p', '--ppm', type=int, default=200, help='tolerance (ppm)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the table and peak lists')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    table = massTable(rng, args.genomes)
+    db = MassDB.fromDict(table)
+    index = MassIndex.build(db.masses, db.offsets)
+    ids = list(db.ids)
+
+    ok = True
+    for n in range(args.lists):
+        peaks = peakList(rng, table, args.ppm)
+        scan = float(rng.choice([0, 20, 100]))
+        bins = [0, 1, -1, 3]
+        s_type = 'ms' if n % 2 == 0 else 'weighted'
+        h0, e0 = vectors(*CalcHit(None, peaks, scan, args.ppm, 1, table, s_type), ids)
+
+        h, e = CalcHitArray(peaks, scan, args.ppm, 1, db.masses, db.offsets, s_type)
+        ok &= same('CalcHitArray', h0, e0, h, e)
+        h, e = CalcHitArray(peaks, scan, args.ppm, 1, db.masses, db.offsets, s_type, index)
+        ok &= same('CalcHitArray (index)', h0, e0, h, e)
+
+        hs, es = CalcHitShiftArray(peaks, scan, args.ppm, bins, db.masses, db.offsets, s_type, index)
+        for k, b in enumerate(bins):
+            h1, e1 = vectors(*CalcHit(None, peaks, scan, args.ppm, b, table, s_type), ids)
+            ok &= same('CalcHitShiftArray (bin %d)' % b, h1, e1, hs[k], es[k])
+
+        other = peakList(rng, table, args.ppm)
+        hb, eb = CalcHitBatchArray([peaks, other], [scan, 0], args.ppm, 1, db.masses, db.offsets,
+                                   s_type)
+        h1, e1 = vectors(*CalcHit(None, other, 0, args.ppm, 1, table, s_type), ids)
+        ok &= same('CalcHitBatchArray', h0, e0, hb[0], eb[0])
+        ok &= same('CalcHitBatchArray', h1, e1, hb[1], eb[1])
+
+        # CalcRamdom divides the deviation by the reference mass
+        random.seed(n)
+        c, d = CalcRamdom(None, [(g, None) for g in ids], peaks, scan, args.ppm, 1, table, s_type)
+        sample = list(c)
+        h, e = CalcHitSubsetArray(peaks, scan, args.ppm, 1, db.masses, db.offsets,
+                                  db.positions(sample), s_type, by_mass=True)
+        ok &= same('CalcHitSubsetArray (by mass)', *vectors(c, d, sample), h, e)
+        h, e = CalcHitSubsetArray(peaks, scan, args.ppm, 1, db.masses, db.offsets,
+                                  db.positions(sample), s_type)
+        ok &= same('CalcHitSubsetArray', h0[db.positions(sample)], e0[db.positions(sample)], h, e)
+
+    print('%d peak lists, %d genomes: %s' % (args.lists, args.genomes, 'ok' if ok else 'FAIL'))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
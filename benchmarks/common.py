@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+
+__author__ = 'Yuji Sekiguchi'
+__copyright__ = 'Copyright (c) 2023 Yuji Sekiguchi, National Institute of Advanced Industrial Science and Technology (AIST)'
+__credits__ = ['Yuji Sekiguchi']
+__license__ = 'GPL3.0'
+__maintainer__ = 'Yuji Sekiguchi'
+__email__ = 'y.sekiguchi@aist.go.jp'
+__status__ = 'Development'
+
+# Helpers shared by the benchmark scripts.
+
+import numpy as np
+
+from GPMsDB_tk.massdb import massValues
+
+
+def peakLists(rng, db, n, ppm):
+    # up to 40 masses of a random genome, moved within the tolerance, and
+    # 10 masses of other genomes
+    lists = []
+    for _ in range(n):
+        g = rng.integers(len(db.ids))
+        own = np.asarray(db[db.ids[g]])
+        own = rng.choice(own, min(len(own), 40), replace=False)
+        own = own * (1 + rng.uniform(-ppm, ppm, len(own)) / 1000000)
+        other = massValues(rng.choice(np.asarray(db.masses), 10), db.scale)
+        lists.append(np.sort(np.concatenate((own, other))))
+
+    return lists
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+__author__ = 'Yuji Sekiguchi'
+__copyright__ = 'Copyright (c) 2023 Yuji Sekiguchi, National Institute of Advanced Industrial Science and Technology (AIST)'
+__credits__ = ['Yuji Sekiguchi']
+__license__ = 'GPL3.0'
+__maintainer__ = 'Yuji Sekiguchi'
+__email__ = 'y.sekiguchi@aist.go.jp'
+__status__ = 'Development'
+
+# Accuracy check of the float32 and int32 (log-m/z) mass storage: writes a
+# pickled mass table in each type to a temporary directory, scores synthetic
+# peak lists drawn from its genomes against each of them and compares the
+# hits and ms sums with the float64 path. Fails when the top hits differ
+# for more than --max_changed of the peak lists.
+#
+#   python benchmarks/quantization.py [mass/all.db] [-n 100] [-p 200]
+
+import os
+import sys
+import pickle
+import argparse
+import tempfile
+
+import numpy as np
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from GPMsDB_tk.defaultValues import DefaultValues
+from GPMsDB_tk.massdb import openMassDb, writeColumnar, massValues
+from GPMsDB_tk.calcvec import CalcHitArray, TopIndices
+from common import peakLists
+
+TYPES = ['float64', 'float32', 'int32']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Accuracy of the quantized mass databases.')
+    parser.add_argument('db_file', nargs='?', default=None, help='pickled mass table (default: mass/all.db)')
+    parser.add_argument('-n', '--lists', type=int, default=100, help='synthetic peak lists')
+    parser.add_argument('-p', '--ppm', type=float, default=DefaultValues.TORELANCE, help='tolerance (ppm)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the peak lists')
+    parser.add_argument('--max_changed', type=float, default=0.01, help='maximum fraction of peak lists with another top hit')
+    args = parser.parse_args()
+
+    db_file = args.db_file or DefaultValues.ALL_ALL_DB
+    with open(db_file, 'rb') as f:
+        table = pickle.load(f)
+
+    tmp_dir = tempfile.mkdtemp()
+    dbs = {}
+    for t in TYPES:
+        writeColumnar(table, os.path.join(tmp_dir, t), t)
+        dbs[t] = openMassDb(os.path.join(tmp_dir, t))
+    del table
+
+    ref = dbs['float64']
+    lists = peakLists(np.random.default_rng(args.seed), ref, args.lists, 0.9 * args.ppm)
+    results = {t: [CalcHitArray(p, 0, args.ppm, 1, db.masses, db.offsets, 'ms', scale=db.scale)
+                   for p in lists] for t, db in dbs.items()}
+
+    failed = False
+    print('%-8s %10s %12s %12s %10s %10s %8s' % ('type', 'MB', 'max err ppm', 'hits differ',
+                                                  'max dhit', 'max dms', 'top1'))
+    for t, db in dbs.items():
+        err = np.abs(massValues(db.masses, db.scale) - ref.masses) / ref.masses * 1000000
+        differ = 0
+        dhit = 0
+        dms = 0.0
+        same_top = 0
+        for (h0, e0), (h, e) in zip(results['float64'], results[t]):
+            differ += int(np.count_nonzero(h != h0))
+            dhit = max(dhit, int(np.abs(h - h0).max()))
+            dms = max(dms, float(np.abs(e - e0).max()))
+            same_top += int(np.array_equal(TopIndices(h, 1), TopIndices(h0, 1)))
+
+        changed = 1 - same_top / len(lists)
+        if changed > args.max_changed:
+            failed = True
+        print('%-8s %10.1f %12.4f %12d %10d %10.2e %7.1f%%' % (
+            t, db.masses.nbytes / 1048576, err.max(), differ, dhit, dms, 100 * same_top / len(lists)))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
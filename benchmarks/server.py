@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+__author__ = 'Yuji Sekiguchi'
+__copyright__ = 'Copyright (c) 2023 Yuji Sekiguchi, National Institute of Advanced Industrial Science and Technology (AIST)'
+__credits__ = ['Yuji Sekiguchi']
+__license__ = 'GPL3.0'
+__maintainer__ = 'Yuji Sekiguchi'
+__email__ = 'y.sekiguchi@aist.go.jp'
+__status__ = 'Development'
+
+# Consistency check of the identification server: starts `serve` for each
+# reference, identifies the given peak lists with `client -aa` and with
+# `identify_wf -aa`, and fails when the m/z adjustment or the ranked tables
+# differ. Needs GPMsDB_PATH (and the custom tables for -r custom).
+#
+#   python benchmarks/server.py sample.txt [...] [-r all custom] [--port 8643]
+
+import os
+import re
+import sys
+import time
+import argparse
+import subprocess
+import urllib.request
+import urllib.error
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROW = re.compile(r'^\S+\t\d+\t\d+\t')
+
+
+def result(out):
+    # adjustment line and table rows, without the log prefix
+    lines = []
+    for line in out.splitlines():
+        line = line.split('INFO: ', 1)[-1]
+        if line.startswith('#Search result here') or ROW.match(line):
+            lines.append(line)
+    return lines
+
+
+def command(env, *args):
+    return subprocess.run([sys.executable, os.path.join(root, 'bin', 'GPMsDB_tk')] + list(args),
+                          env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          text=True).stdout
+
+
+def waitServer(port, timeout):
+    url = 'http://127.0.0.1:' + str(port) + '/status'
+    end = time.time() + timeout
+    while time.time() < end:
+        try:
+            with urllib.request.urlopen(url):
+                return True
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.5)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Server results against identify_wf.')
+    parser.add_argument('input_files', nargs='+', help='peak-list files')
+    parser.add_argument('-r', '--references', nargs='+', default=['all', 'custom'],
+                        choices=['reps', 'all', 'custom'], help='references to check')
+    parser.add_argument('--port', type=int, default=8643, help='port of the test server')
+    parser.add_argument('--timeout', type=float, default=600, help='loading time limit of the server (s)')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(p for p in [root, env.get('PYTHONPATH')] if p)
+
+    failed = False
+    for reference in args.references:
+        server = subprocess.Popen([sys.executable, os.path.join(root, 'bin', 'GPMsDB_tk'), 'serve',
+                                   '-r', reference, '--port', str(args.port), '--silent'],
+                                  env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if not waitServer(args.port, args.timeout):
+                print('%-8s server not started' % reference)
+                failed = True
+                continue
+
+            for input_file in args.input_files:
+                served = result(command(env, 'client', '--port', str(args.port), '-aa', input_file))
+                local = result(command(env, 'identify_wf', '-aa', '-r', reference, input_file))
+                status = 'ok'
+                if len(local) == 0 or served != local:
+                    status = 'FAIL'
+                    failed = True
+                print('%-8s %-40s %s' % (reference, os.path.basename(input_file), status))
+        finally:
+            server.terminate()
+            server.wait()
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
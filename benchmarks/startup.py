@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+__author__ = 'Yuji Sekiguchi'
+__copyright__ = 'Copyright (c) 2023 Yuji Sekiguchi, National Institute of Advanced Industrial Science and Technology (AIST)'
+__credits__ = ['Yuji Sekiguchi']
+__license__ = 'GPL3.0'
+__maintainer__ = 'Yuji Sekiguchi'
+__email__ = 'y.sekiguchi@aist.go.jp'
+__status__ = 'Development'
+
+# Cold-start benchmark: times fresh interpreters importing the CLI and the
+# batch worker modules, and fails when a heavy dependency is loaded there
+# again or when the median time exceeds --limit.
+#
+#   python benchmarks/startup.py [-n 10] [--limit 0.5]
+
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+# modules whose import must not pull in matplotlib/scipy
+MODULES = ['GPMsDB_tk.main', 'GPMsDB_tk.loop', 'GPMsDB_tk.searchbest', 'GPMsDB_tk.peakparser']
+HEAVY = ['matplotlib', 'scipy']
+
+PROBE = '''
+import sys, time
+t = time.perf_counter()
+import {module}
+t = time.perf_counter() - t
+print(t, ','.join(m for m in {heavy!r} if m in sys.modules))
+'''
+
+
+def probe(module, env):
+    out = subprocess.run([sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY)],
+                         env=env, check=True, capture_output=True, text=True).stdout.split()
+    return float(out[0]), out[1].split(',') if len(out) > 1 else []
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold-start benchmark of GPMsDB-tk.')
+    parser.add_argument('-n', '--repeats', type=int, default=10, help='fresh interpreters per module')
+    parser.add_argument('--limit', type=float, default=None, help='maximum median import time (s)')
+    args = parser.parse_args()
+
+    # the source tree this script belongs to comes first
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(p for p in [root, env.get('PYTHONPATH')] if p)
+
+    failed = False
+    for module in MODULES:
+        times = []
+        loaded = set()
+        for _ in range(args.repeats):
+            t, heavy = probe(module, env)
+            times.append(t)
+            loaded.update(heavy)
+
+        median = statistics.median(times)
+        status = 'ok'
+        if loaded:
+            status = 'FAIL (loads ' + ', '.join(sorted(loaded)) + ')'
+            failed = True
+        elif args.limit is not None and median > args.limit:
+            status = 'FAIL (over ' + str(args.limit) + ' s)'
+            failed = True
+        print('%-24s median %.3f s, min %.3f s  %s' % (module, median, min(times), status))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()